@@ -1,6 +1,7 @@
 from nicegui import ui
 from typing import Optional, Dict, Any
 import os
+from services.thumbnails import cover_url as book_cover_url, thumb_url
 
 
 def book_card(book_data: Dict[str, Any], on_click=None):
@@ -16,9 +17,8 @@ def book_card(book_data: Dict[str, Any], on_click=None):
     authors = book_data.get('authors', [{'name': 'Unknown'}])
     author_names = ', '.join(author.get('name', 'Unknown') for author in authors)
     
-    # Get cover image URL from formats, or use a placeholder
-    formats = book_data.get('formats', {})
-    cover_url = formats.get('image/jpeg', 'https://via.placeholder.com/150x200?text=No+Cover')
+    # Get a thumbnail of the (mirrored) cover, or the locally drawn placeholder
+    cover_url = book_cover_url(book_data, 'md') or thumb_url(book_data.get('id'), 'md')
     
     # Get description from summaries or use a default
     description = book_data.get('summaries', ['No description available.'])[0]
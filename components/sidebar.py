@@ -1,10 +1,5 @@
-import json
-from pathlib import Path
 from nicegui import ui, app 
-
-# --- CONFIGURATION ---
-BASE_DIR = Path(__file__).parent.parent
-USERS_DIR = BASE_DIR / 'data' / 'users'
+from services import chats
 
 def sidebar():
     user = app.storage.user
@@ -33,26 +28,7 @@ def sidebar():
     # --- HELPER: GET PRIVATE HISTORY ---
     def get_user_chats():
         if not is_logged_in: return []
-        
-        safe_name = "".join([c for c in username if c.isalpha() or c.isdigit()])
-        chat_folder = USERS_DIR / safe_name / 'chats'
-        
-        if not chat_folder.exists(): return []
-
-        chats = []
-        for file_path in chat_folder.glob('*.json'):
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    chats.append({
-                        'id': data.get('id'),
-                        'title': data.get('title', 'Untitled Chat'),
-                        'timestamp': data.get('timestamp', '')
-                    })
-            except: continue
-            
-        chats.sort(key=lambda x: x['timestamp'], reverse=True)
-        return chats
+        return chats.recent_chats(username)
 
     with ui.left_drawer(value=True).classes('bg-white border-r border-gray-200 w-64') as drawer:
         # Header
@@ -89,7 +65,7 @@ def sidebar():
                     if not recent:
                          ui.label('No history yet.').classes('px-4 py-1 text-xs text-gray-400 italic')
                     else:
-                        for chat in recent[:5]: 
+                        for chat in recent: 
                             with ui.row().classes('w-full px-4 py-2 cursor-pointer hover:bg-gray-50 truncate').on('click', lambda c=chat['id']: ui.navigate.to(f'/chat?chat_id={c}')):
                                 ui.label(chat['title']).classes('text-xs text-gray-500 truncate w-full')
                 else:
@@ -1,10 +1,13 @@
-import json
 import os
 from pathlib import Path
 from typing import Dict, Optional
-from nicegui import ui, app
+from nicegui import ui, app, run
 from components.header import header
 from components.sidebar import sidebar
+from services import artifacts, storage
+from services.catalog import catalog
+from services.static import versioned
+from services.thumbnails import cover_url as book_cover_url
 
 # Import the bookmark backend logic
 from pages.bookmark import toggle_bookmark, is_bookmarked 
@@ -26,15 +29,15 @@ def get_file_info(book_data: Dict):
     
     # Fallback for old manual books that might just have content.txt
     if not filename:
-        if book_data.get('content'):
+        if has_content(book_data['id']):
             return (None, 'text', True)
         return (None, 'unknown', False)
 
     # 2. Determine Type based on extension
     ext = os.path.splitext(filename)[1].lower()
     
-    # URL structure: /covers/{book_id}/{filename}
-    file_url = f"/covers/{book_data['id']}/{filename}"
+    # URL structure: /covers/{book_id}/{filename}?v={fingerprint}
+    file_url = versioned(f"/covers/{book_data['id']}/{filename}", BOOKS_DIR / str(book_data['id']) / filename)
     
     if ext == '.pdf':
         return (file_url, 'pdf', False) # Browser handles PDF
@@ -45,34 +48,30 @@ def get_file_info(book_data: Dict):
     else:
         return (file_url, 'download', False) # DOCX, PPT, etc.
 
-def load_book(book_id: str) -> Optional[Dict]:
-    """Load a book's metadata."""
-    book_dir = BOOKS_DIR / str(book_id)
-    metadata_path = book_dir / 'metadata.json'
-    
-    if not metadata_path.exists():
+async def load_book(book_id: str) -> Optional[Dict]:
+    """Load a book's metadata only. Use artifacts.read_preview() for the start of its text."""
+    book_data = catalog.get(book_id)
+    if book_data is None:
+        # Just uploaded and the watcher hasn't caught up yet: read this one book now
+        await catalog.refresh([book_id])
+        book_data = catalog.get(book_id)
+    if book_data is None:
         return None
-        
+    # Copy, the catalog's dicts are shared between all visitors
+    return dict(book_data)
+
+def has_content(book_id: str) -> bool:
+    """Whether the book has a non-empty content.txt (legacy plain-text books)."""
     try:
-        with open(metadata_path, 'r', encoding='utf-8') as f:
-            book_data = json.load(f)
-            if 'id' not in book_data: book_data['id'] = book_id
-            
-        # Try to load raw text content if it exists (legacy support)
-        content_path = book_dir / 'content.txt'
-        if content_path.exists():
-            with open(content_path, 'r', encoding='utf-8') as f:
-                book_data['content'] = f.read()
-            
-        return book_data
-    except Exception as e:
-        return None
+        return (BOOKS_DIR / str(book_id) / 'content.txt').stat().st_size > 0
+    except OSError:
+        return False
 
 @ui.page('/book/{book_id}')
-def book_detail_page(book_id: str):
+async def book_detail_page(book_id: str):
     
     # 1. Load Data
-    book = load_book(book_id)
+    book = await load_book(book_id)
     nav = sidebar()
     header(nav)
     
@@ -92,20 +91,13 @@ def book_detail_page(book_id: str):
     subjects = book.get('subjects', [])
     
     # Image Logic
-    local_cover = BOOKS_DIR / str(book_id) / 'cover.jpg'
-    if not local_cover.exists():
-        local_cover = BOOKS_DIR / str(book_id) / 'cover.png'
-        
-    if local_cover.exists():
-        cover_url = f'/covers/{book_id}/{local_cover.name}'
-    else:
-        cover_url = book.get('formats', {}).get('image/jpeg', None)
+    cover_url = book_cover_url(book, 'lg')
 
     # File Type Logic
     file_url, file_type, is_readable = get_file_info(book)
 
     # Check Bookmark Status (Backend)
-    saved_state = is_bookmarked(book_id)
+    saved_state = await is_bookmarked(book_id)
 
     # 3. Main Content
     with ui.column().classes('w-full min-h-screen bg-gray-50 pb-20'):
@@ -149,8 +141,12 @@ def book_detail_page(book_id: str):
                         ui.button('Unavailable', icon='block').classes('w-full').props('disabled outline')
 
                     # 2. SECONDARY ACTION (Bookmark)
-                    def handle_bookmark_click(btn):
-                        new_state = toggle_bookmark(book_id)
+                    async def handle_bookmark_click(btn):
+                        try:
+                            new_state = await toggle_bookmark(book_id)
+                        except storage.CorruptFileError:
+                            ui.notify('Your bookmark list is damaged, nothing was changed.', color='negative')
+                            return
                         if new_state:
                             btn.props('icon=bookmark color=pink-100 text-color=pink-600')
                             btn.text = 'Saved to List'
@@ -190,11 +186,13 @@ def book_detail_page(book_id: str):
                 ui.markdown(description).classes('text-gray-700 leading-relaxed text-lg max-w-prose')
 
         # --- PREVIEW SECTION (Only for Readable Text) ---
-        if book.get('content') and len(book['content']) > 100:
+        # From the cleaned text the reader shows; built on first use, so off the event loop
+        preview_text = await run.io_bound(artifacts.read_preview, book_id, 1000) or ''
+        if len(preview_text) > 100:
             with ui.column().classes('w-full max-w-7xl mx-auto px-6 mt-12'):
                 ui.label('Preview').classes('text-2xl font-bold text-gray-800 mb-4')
                 with ui.card().classes('w-full bg-orange-50/30 border-none p-8 shadow-inner'):
-                    preview_text = book['content'][:1000] + "..."
+                    preview_text = preview_text + "..."
                     ui.markdown(preview_text).classes('font-serif text-gray-700 leading-loose text-lg whitespace-pre-line')
                     with ui.button('Continue Reading', icon='arrow_forward', on_click=lambda: ui.navigate.to(f'/read/{book_id}')) \
                         .classes('mt-4').props('flat color=indigo'):
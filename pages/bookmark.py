@@ -1,13 +1,14 @@
-import json
 from pathlib import Path
 from nicegui import ui, app
 from components.header import header
 from components.sidebar import sidebar
+from services import storage
+from services.catalog import catalog
+from services.thumbnails import cover_url
 
 # --- CONFIGURATION ---
 BASE_DIR = Path(__file__).parent.parent
 USERS_DIR = BASE_DIR / 'data' / 'users'
-BOOKS_DIR = BASE_DIR / 'data' / 'books'
 
 # --- BACKEND LOGIC (Helpers) ---
 
@@ -18,63 +19,48 @@ def get_bookmark_file():
     safe_name = "".join([c for c in username if c.isalpha() or c.isdigit()])
     return USERS_DIR / safe_name / 'bookmarks.json'
 
-def load_bookmarks():
+async def load_bookmarks():
     """Returns a list of book IDs that are bookmarked."""
     f = get_bookmark_file()
-    if not f or not f.exists(): return []
-    try:
-        with open(f, 'r') as file:
-            return json.load(file)
-    except: return []
+    if not f: return []
+    bookmarks = await storage.read_json(f, [])
+    return bookmarks if isinstance(bookmarks, list) else []
 
-def toggle_bookmark(book_id):
+async def toggle_bookmark(book_id):
     """Adds or removes a book ID from the user's list."""
     f = get_bookmark_file()
     if not f: return False
     
-    bookmarks = load_bookmarks()
-    
-    if book_id in bookmarks:
-        bookmarks.remove(book_id)
-        is_bookmarked = False
-    else:
+    def toggle(bookmarks):
+        if book_id in bookmarks:
+            bookmarks.remove(book_id)
+            return False
         bookmarks.append(book_id)
-        is_bookmarked = True
-        
-    with open(f, 'w') as file:
-        json.dump(bookmarks, file)
+        return True
         
-    return is_bookmarked
+    # Read and write under the file's lock, so two tabs can't undo each other's clicks
+    return await storage.update_json(f, toggle, [])
 
-def is_bookmarked(book_id):
-    return book_id in load_bookmarks()
+async def is_bookmarked(book_id):
+    return book_id in await load_bookmarks()
 
 # --- FRONTEND UI (The Page) ---
 
 @ui.page('/bookmarks')
-def bookmarks_page():
+async def bookmarks_page():
     if not app.storage.user.get('authenticated'): return ui.navigate.to('/login')
 
     nav = sidebar()
     header(nav)
     
     # 1. Load Data
-    bookmark_ids = load_bookmarks()
+    bookmark_ids = await load_bookmarks()
     books = []
 
-    # Load metadata for each bookmarked ID
-    if bookmark_ids and BOOKS_DIR.exists():
-        for b_id in bookmark_ids:
-            # FIX: Convert b_id to string here
-            meta_path = BOOKS_DIR / str(b_id) / 'metadata.json'
-            
-            if meta_path.exists():
-                try:
-                    with open(meta_path, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        if 'id' not in data: data['id'] = b_id
-                        books.append(data)
-                except: continue
+    # Look up metadata for each bookmarked ID
+    for b_id in bookmark_ids:
+        data = catalog.get(b_id)
+        if data: books.append(data)
 
     # 2. Render Page
     with ui.column().classes('w-full min-h-screen bg-gray-50 p-4 md:p-8'):
@@ -88,6 +74,10 @@ def bookmarks_page():
                 ui.label('No bookmarks yet.').classes('text-xl font-bold text-gray-400')
                 ui.button('Browse Library', on_click=lambda: ui.navigate.to('/books')).props('outline')
         else:
+            async def remove_bookmark(book):
+                await toggle_bookmark(book['id'])
+                ui.navigate.reload()
+
             # Reusing the grid layout style
             with ui.grid().classes('w-full gap-6 grid-cols-2 md:grid-cols-3 lg:grid-cols-4 xl:grid-cols-5'):
                 for book in books:
@@ -96,7 +86,7 @@ def bookmarks_page():
                             .on('click', lambda b=book: ui.navigate.to(f'/book/{b["id"]}')):
                         
                         # Image
-                        cover = book.get('formats', {}).get('image/jpeg')
+                        cover = cover_url(book, 'sm')
                         if cover:
                             ui.image(cover).classes('w-full aspect-[2/3] object-cover')
                         else:
@@ -110,5 +100,5 @@ def bookmarks_page():
                             # Remove Button
                             with ui.button(icon='delete', color='red').props('flat dense size=sm') \
                                     .classes('self-end mt-2 opacity-0 group-hover:opacity-100 transition-opacity') \
-                                    .on('click.stop', lambda b=book: [toggle_bookmark(b['id']), ui.navigate.reload()]):
+                                    .on('click.stop', lambda b=book: remove_bookmark(b)):
                                 ui.tooltip('Remove from list')
\ No newline at end of file
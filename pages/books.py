@@ -1,9 +1,14 @@
-import json
+import asyncio
 from pathlib import Path
-from typing import Dict, List
-from nicegui import app, ui
+from typing import Dict, List, Optional, Tuple
+from nicegui import run, ui
 from components.header import header
 from components.sidebar import sidebar
+from services import static
+from services.catalog import catalog
+from services.facets import facet_index
+from services.search import search_index
+from services.thumbnails import cover_url as book_cover_url
 
 # Ensure detail routes are registered if needed
 import pages.book.book_details
@@ -15,31 +20,56 @@ if not (BASE_DIR / 'data').exists():
 BOOKS_DIR = BASE_DIR / 'data' / 'books'
 
 # --- CONFIGURATION ---
+# Cards per page of the grid; only these exist as elements in the browser
+PAGE_SIZE = 24
+
+# Seconds of quiet in the search box before a search starts
+SEARCH_DEBOUNCE = 0.25
+
+# How many values the subject and author filters offer
+FACET_OPTIONS = 200
+
 # This tells NiceGUI: "When the browser asks for /covers/..., look inside the books folder"
-app.add_static_files('/covers', BOOKS_DIR)
+# (with ETags, and year-long caching for fingerprinted ?v= URLs)
+static.add_static_files('/covers', BOOKS_DIR)
 
 # --- DATA LOADING ---
 def load_books() -> List[Dict]:
-    """Load all books with robust error handling."""
-    books = []
-    if not BOOKS_DIR.exists():
-        return books
-        
-    for book_dir in BOOKS_DIR.iterdir():
-        if not book_dir.is_dir(): continue
-        
-        metadata_path = book_dir / 'metadata.json'
-        if not metadata_path.exists(): continue
-            
-        try:
-            with open(metadata_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                if 'id' not in data: data['id'] = book_dir.name
-                if 'subjects' not in data: data['subjects'] = ['Uncategorized']
-                books.append(data)
-        except:
-            continue
-    return books
+    """Return all books from the shared in-memory catalog."""
+    return catalog.all()
+
+def load_categories() -> List[str]:
+    """Category names, largest group first."""
+    return [cat for cat, _ in facet_index.counts('category')]
+
+def facet_options(facet: str, limit: int = FACET_OPTIONS) -> Dict[str, str]:
+    """The most common values of a facet, as select options labelled with their counts."""
+    return {value: f'{value} ({count})' for value, count in facet_index.counts(facet, limit)}
+
+def filter_books(query: str, active_cat: str, filters: Dict[str, str] = None,
+                 limit: Optional[int] = None) -> Tuple[List[Dict], int]:
+    """
+    The first `limit` books matching a search, a category tab and facet
+    filters, best matches first, and how many match in all.
+    """
+    filters = {facet: value for facet, value in (filters or {}).items() if value}
+    if active_cat != "All Books":
+        filters['category'] = active_cat
+
+    # A. Filter by Search Term (ranked, via the shared index; only the shown pages get sorted)
+    if query.strip():
+        # B. Rank only the matches that have every selected facet value
+        allowed = set(facet_index.select(filters)) if filters else None
+        book_ids, total = search_index.search_top(query, limit, within=allowed)
+    elif filters:
+        book_ids = facet_index.select(filters)
+        total = len(book_ids)
+    else:
+        books = load_books()
+        return books[:limit], len(books)
+
+    books = [catalog.get(book_id) for book_id in book_ids[:limit]]
+    return [b for b in books if b is not None], total
 
 # --- UI COMPONENTS ---
 
@@ -54,15 +84,8 @@ def render_book_card(book: Dict):
         author_name = 'Unknown'
     
     # --- IMAGE LOGIC START ---
-    # 1. Check if we have a local cover cached
-    local_cover_path = BOOKS_DIR / book_id / 'cover.jpg'
-    
-    if local_cover_path.exists():
-        # Use the local static route
-        cover_url = f'/covers/{book_id}/cover.jpg'
-    else:
-        # Fallback to remote URL (or placeholder)
-        cover_url = book.get('formats', {}).get('image/jpeg')
+    # A card-sized thumbnail of the local cover, or the remote URL as a fallback
+    cover_url = book_cover_url(book, 'md')
     # --- IMAGE LOGIC END ---
     
     with ui.card().classes('w-full h-[360px] p-0 gap-0 group hover:shadow-xl transition-all duration-300 cursor-pointer overflow-hidden bg-white border-none') \
@@ -100,18 +123,13 @@ def render_book_card(book: Dict):
 # --- MAIN PAGE ---
 
 @ui.page('/books')
-def books_page():
+async def books_page():
     # 1. Load Data
-    all_books = load_books()
-    
-    categories = {}
-    for b in all_books:
-        cat = b.get('subjects', ['Uncategorized'])[0] if b.get('subjects') else 'Uncategorized'
-        simple_cat = cat.split(' -- ')[0] 
-        if simple_cat not in categories: categories[simple_cat] = []
-        categories[simple_cat].append(b)
-    
-    sorted_cats = sorted(categories.keys(), key=lambda k: len(categories[k]), reverse=True)
+    # Counting is cached per catalog change, but the first visit after one
+    # ranks every author and subject; keep that off the event loop
+    sorted_cats = await run.io_bound(load_categories)
+    options = {facet: await run.io_bound(facet_options, facet) for facet in ('language', 'subject', 'author')}
+    all_results, total = await run.io_bound(filter_books, '', 'All Books', None, PAGE_SIZE)
 
     # 2. Page Setup
     # NEW WAY (Connects them together)
@@ -121,46 +139,75 @@ def books_page():
     # 3. State Management
     state = {
         'search_term': '',
-        'current_tab': 'All Books'
+        'current_tab': 'All Books',
+        'filters': {'language': None, 'subject': None, 'author': None},
+        'page': 1,
+        'results': all_results,   # the books of pages 1 to 'page'
+        'total': total,
+        'request': 0     # bumped by every search, so stale ones can tell they lost
     }
 
     # 4. The Unified Grid Function
     @ui.refreshable
     def books_grid():
-        query = state['search_term'].lower()
-        active_cat = state['current_tab']
+        filtered_books = state['results']
 
-        # A. Filter by Category
-        if active_cat == "All Books":
-            books_pool = all_books
-        else:
-            books_pool = categories.get(active_cat, [])
-
-        # B. Filter by Search Term
-        filtered_books = [
-            b for b in books_pool 
-            if query in b.get('title', '').lower() 
-            or query in str(b.get('authors', '')).lower()
-        ]
-
-        # C. Render Logic
-        if not filtered_books:
+        # C. Render Logic: only the cards of the current page are built
+        if not state['total']:
             with ui.column().classes('w-full py-20 items-center justify-center text-center opacity-60'):
                 ui.icon('search_off', size='4em').classes('text-gray-300 mb-4')
                 ui.label('No books match your search').classes('text-xl font-bold text-gray-400')
         else:
+            page_count = (state['total'] + PAGE_SIZE - 1) // PAGE_SIZE
+            start = (state['page'] - 1) * PAGE_SIZE
+
             with ui.grid().classes('w-full gap-6 grid-cols-2 md:grid-cols-3 lg:grid-cols-4 xl:grid-cols-5'):
-                for book in filtered_books:
+                for book in filtered_books[start:start + PAGE_SIZE]:
                     render_book_card(book)
 
+            if page_count > 1:
+                with ui.row().classes('w-full justify-center items-center gap-4 mt-8'):
+                    ui.pagination(1, page_count, direction_links=True, value=state['page'],
+                                  on_change=handle_page_change)
+                    ui.label(f"{state['total']} books").classes('text-sm text-gray-400')
+
     # 5. EVENT HANDLERS
-    def handle_search(e):
-        state['search_term'] = e.value
+    async def update_results(debounce: float = 0, page: int = 1):
+        """Filter off the event loop and show `page` of the result, unless a newer request came in meanwhile."""
+        state['request'] += 1
+        request = state['request']
+        if debounce:
+            await asyncio.sleep(debounce)
+            if request != state['request']: return  # superseded while waiting
+
+        results, total = await run.io_bound(filter_books, state['search_term'], state['current_tab'],
+                                            state['filters'], page * PAGE_SIZE)
+        if request != state['request']: return      # superseded while filtering
+
+        state['results'], state['total'] = results, total
+        state['page'] = page
         books_grid.refresh()
 
-    def handle_tab_change(e):
+    async def handle_search(e):
+        state['search_term'] = e.value
+        await update_results(SEARCH_DEBOUNCE)
+
+    async def handle_tab_change(e):
         state['current_tab'] = e.value
-        books_grid.refresh()
+        await update_results()
+
+    async def handle_filter_change(facet, value):
+        state['filters'][facet] = value
+        await update_results()
+
+    async def handle_page_change(e):
+        if e.value == state['page']: return
+        if len(state['results']) < min(e.value * PAGE_SIZE, state['total']):
+            await update_results(page=e.value)    # rank as far as the new page
+        else:
+            state['page'] = e.value
+            books_grid.refresh()
+        ui.run_javascript('window.scrollTo({top: 0, behavior: "smooth"})')
 
     # 6. Main Layout
     with ui.column().classes('w-full min-h-screen bg-gray-50/50'):
@@ -170,7 +217,7 @@ def books_page():
             with ui.row().classes('w-full max-w-7xl mx-auto items-end justify-between gap-6'):
                 with ui.column().classes('gap-2'):
                     ui.label('Library').classes('text-4xl font-black text-gray-900 tracking-tight')
-                    ui.label(f'{len(all_books)} books available for reading').classes('text-gray-500 font-medium')
+                    ui.label(f'{len(catalog)} books available for reading').classes('text-gray-500 font-medium')
                 
                 # --- SEARCH INPUT ---
                 ui.input(placeholder='Search title or author...', 
@@ -189,6 +236,14 @@ def books_page():
                 ui.tab('All Books')
                 for cat in sorted_cats[:6]: 
                     ui.tab(cat)
+
+            # --- FACET FILTERS ---
+            with ui.row().classes('w-full gap-4 mb-8'):
+                for facet, label in (('language', 'Language'), ('subject', 'Subject'), ('author', 'Author')):
+                    ui.select(options[facet], label=label, clearable=True, with_input=True,
+                              on_change=lambda e, f=facet: handle_filter_change(f, e.value)) \
+                        .props('outlined dense options-dense') \
+                        .classes('w-full md:w-64 bg-white')
             
             # --- THE GRID ---
             books_grid()
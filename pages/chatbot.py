@@ -1,52 +1,92 @@
-import json
+import time
 import uuid
-from pathlib import Path
+from contextlib import aclosing
 from datetime import datetime
-from nicegui import ui, app
+from nicegui import ui, app, run
 from components.header import header
 from components.sidebar import sidebar
+from services import chats, llm
+from services.catalog import catalog
+from services.search import search_index
+from services.vectors import vector_index
 
 # --- CONFIGURATION ---
-BASE_DIR = Path(__file__).parent.parent
-USERS_DIR = BASE_DIR / 'data' / 'users'
-BOOKS_DIR = BASE_DIR / 'data' / 'books'
+SYSTEM_PROMPT = (
+    "You are Libre AI, the assistant of the Libre Library. Help students find books "
+    "and understand them. Answer from the passages you are given when they are relevant, "
+    "say which book they come from, and keep answers short."
+)
+HISTORY_MESSAGES = 10    # earlier messages of the chat sent along with a question
+STREAM_INTERVAL = 0.05   # seconds between redraws of an answer that is streaming in
 
-# --- HELPER 1: GET PRIVATE CHAT FOLDER ---
-def get_user_chat_folder():
-    """Returns the path to the logged-in user's private chat folder."""
-    if not app.storage.user.get('authenticated'):
-        return None
-        
-    username = app.storage.user.get('username')
-    safe_name = "".join([c for c in username if c.isalpha() or c.isdigit()])
-    
-    # Folder: data/users/Joseph/chats/
-    chat_folder = USERS_DIR / safe_name / 'chats'
-    chat_folder.mkdir(parents=True, exist_ok=True)
-    return chat_folder
-
-# --- HELPER 2: THE "BRAIN" (Book Search) ---
+# --- HELPER: THE "BRAIN" (Book Search) ---
 def search_library(query):
-    """Searches the books folder for titles/authors matching the query."""
+    """Searches the shared index for titles/authors/subjects matching the query."""
     results = []
-    if not BOOKS_DIR.exists(): return []
-    
-    query = query.lower()
-    for book_dir in BOOKS_DIR.iterdir():
-        if not book_dir.is_dir(): continue
-        try:
-            with open(book_dir / 'metadata.json', 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                title = data.get('title', '').lower()
-                author = str(data.get('authors', '')).lower()
-                
-                if query in title or query in author:
-                    results.append(data.get('title', 'Untitled'))
-        except: continue
+    # One more than the five listed, to know whether to add "(and more...)"
+    for book_id in search_index.search(query, limit=6):
+        data = catalog.get(book_id)
+        if data: results.append(data.get('title', 'Untitled'))
     return results
 
+def passage_source(passage):
+    """Book title and a link to the passage's page in the reader, as markdown."""
+    title = (catalog.get(passage['book_id']) or {}).get('title', 'Untitled')
+    page = passage['page'] + 1
+    return f"**{title}**, [page {page}](/read/{passage['book_id']}?page={page})"
+
+def answer_from_passages(question):
+    """Quotes the book passages closest to the question, with links into the reader."""
+    passages = vector_index.search(question)
+    if not passages: return None
+    lines = ["Here is what I found in the library:"]
+    for p in passages:
+        lines.append(f"> {p['snippet']}\n\n— {passage_source(p)}")
+    return "\n\n".join(lines)
+
+def is_search_request(text):
+    clean_text = text.lower()
+    return "find" in clean_text or "search" in clean_text or "books about" in clean_text
+
+def library_reply(text):
+    """The answer without a language model: catalog search for "find ..." requests, passages otherwise."""
+    if is_search_request(text):
+        # Extract search term (very basic)
+        search_term = text.replace("find", "").replace("search", "").replace("books about", "").strip()
+        
+        if len(search_term) < 2:
+            return "What topic should I search for? (e.g., 'Find Python')"
+        results = search_library(search_term)
+        if results:
+            book_list = "\n".join([f"- **{t}**" for t in results[:5]])
+            response = f"I found these books matching '{search_term}':\n\n{book_list}"
+            if len(results) > 5: response += "\n\n(and more...)"
+            return response
+        return f"I couldn't find any books about '{search_term}' in the library."
+
+    # Anything else is answered from the books themselves
+    return answer_from_passages(text) or \
+        "I can help you find resources. Try saying 'Find books about Biology'."
+
+# --- HELPER: THE LANGUAGE MODEL ---
+def build_prompt(history, question, passages):
+    """The chat messages sent to the model: instructions, retrieved passages, recent history, the question."""
+    messages = [{'role': 'system', 'content': SYSTEM_PROMPT}]
+    if passages:
+        context = "\n\n".join(
+            f"[{(catalog.get(p['book_id']) or {}).get('title', 'Untitled')}, page {p['page'] + 1}] {p['snippet']}"
+            for p in passages)
+        messages.append({'role': 'system', 'content': f"Passages from the library:\n\n{context}"})
+    for msg in history:
+        messages.append({'role': 'user' if msg['is_user'] else 'assistant', 'content': msg['text']})
+    messages.append({'role': 'user', 'content': question})
+    return messages
+
+def sources(passages):
+    return "Sources:\n\n" + "\n".join(f"- {passage_source(p)}" for p in passages)
+
 @ui.page('/chat')
-def chat_page(chat_id: str = None):
+async def chat_page(chat_id: str = None):
     
     # Security: Redirect guests
     if not app.storage.user.get('authenticated'):
@@ -57,135 +97,191 @@ def chat_page(chat_id: str = None):
     header(nav)      # 2. Pass it to Header
 
     # --- 1. STATE ---
+    username = app.storage.user.get('username')
     state = {
-        'current_chat_id': chat_id,
-        'messages': []
+        'current_chat_id': chat_id if chats.valid_id(chat_id) else None,
+        'messages': [],         # the window loaded when the page opened
+        'start': None,          # log offset of the oldest message on screen
+        'older': False,         # whether the log has messages before it
+        'loading_older': False,
+        'empty_state': None,
+        'replying': False,
     }
-    
-    chat_folder = get_user_chat_folder()
 
     # --- 2. DATA HANDLERS ---
-    def load_current_chat():
+    async def load_current_chat():
         if not state['current_chat_id']:
             state['messages'] = []
             return
 
-        file_path = chat_folder / f"{state['current_chat_id']}.json"
-        if file_path.exists():
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    state['messages'] = data.get('messages', [])
-            except:
-                state['messages'] = []
-        else:
+        # Only the most recent messages; the log is read backwards from its end
+        chat = await chats.load_chat(username, state['current_chat_id'])
+        if chat is None:
+            # Unknown or deleted chat: start a new one instead
+            state['current_chat_id'] = None
             state['messages'] = []
+            return
+        state['messages'] = chat['messages']
+        state['start'], state['older'] = chat['start'], chat['older']
+        state['title'] = chat['header'].get('title', 'Untitled Chat')
 
-    def save_current_chat():
+    async def save_message(message):
+        """Append one message to the chat's log, creating the chat with the first one."""
         if not state['current_chat_id']:
             state['current_chat_id'] = str(uuid.uuid4())
             # Title logic
-            first_msg = state['messages'][0]['text'] if state['messages'] else "New Chat"
+            first_msg = message['text']
             title = first_msg[:30] + "..." if len(first_msg) > 30 else first_msg
-        else:
-            title = "Conversation"
-            old_path = chat_folder / f"{state['current_chat_id']}.json"
-            if old_path.exists():
-                try:
-                    with open(old_path, 'r') as f:
-                        title = json.load(f).get('title', title)
-                except: pass
-
-        data = {
+            created = await chats.create_chat(username, state['current_chat_id'], title)
+            state['title'] = created['title']
+
+        await chats.append_message(username, state['current_chat_id'], message)
+        state['messages'].append(message)
+        # Keep the sidebar's list of recent chats in step
+        await chats.record_chat(username, {
             'id': state['current_chat_id'],
-            'title': title,
+            'title': state['title'],
             'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            'messages': state['messages']
-        }
-
-        file_path = chat_folder / f"{state['current_chat_id']}.json"
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2)
+        })
 
     # --- 3. UI COMPONENTS ---
-    @ui.refreshable
-    def chat_area():
-        if not state['messages']:
-            with ui.column().classes('w-full h-full items-center justify-center opacity-60'):
-                ui.icon('auto_awesome', size='4em').classes('text-indigo-300 mb-4')
-                ui.label('Libre AI Assistant').classes('text-2xl font-bold text-gray-600')
-                ui.label('Ask me to find books or help with your studies.').classes('text-gray-400')
-        else:
-            for msg in state['messages']:
-                is_user = msg['is_user']
-                row_align = 'justify-end' if is_user else 'justify-start'
-                bg_color = 'bg-indigo-50' if is_user else 'bg-white'
-                
-                with ui.row().classes(f'w-full {row_align} gap-3 mb-4'):
-                    if not is_user:
-                        ui.avatar(icon='auto_awesome').classes('bg-gradient-to-br from-indigo-500 to-purple-500 text-white shadow-sm')
-                    
-                    with ui.column().classes(f'max-w-xl {"items-end" if is_user else "items-start"}'):
-                        with ui.element('div').classes(f'{bg_color} text-gray-800 rounded-2xl px-6 py-4 shadow-sm border border-gray-100'):
-                            ui.markdown(msg['text']).classes('text-base leading-relaxed')
-
-                    if is_user:
-                        ui.avatar(icon='person').classes('bg-indigo-600 text-white shadow-sm')
+    # Messages are added to and taken from the page one element at a time;
+    # nothing already on screen is rebuilt when a message is sent.
+    def message_row(msg):
+        is_user = msg['is_user']
+        row_align = 'justify-end' if is_user else 'justify-start'
+        bg_color = 'bg-indigo-50' if is_user else 'bg-white'
+        
+        with ui.row().classes(f'w-full {row_align} gap-3 mb-4') as row:
+            if not is_user:
+                ui.avatar(icon='auto_awesome').classes('bg-gradient-to-br from-indigo-500 to-purple-500 text-white shadow-sm')
+            
+            with ui.column().classes(f'max-w-xl {"items-end" if is_user else "items-start"}'):
+                with ui.element('div').classes(f'{bg_color} text-gray-800 rounded-2xl px-6 py-4 shadow-sm border border-gray-100'):
+                    content = ui.markdown(msg['text']).classes('text-base leading-relaxed')
+
+            if is_user:
+                ui.avatar(icon='person').classes('bg-indigo-600 text-white shadow-sm')
+        return row, content
+
+    def empty_state():
+        with ui.column().classes('w-full h-full items-center justify-center opacity-60') as column:
+            ui.icon('auto_awesome', size='4em').classes('text-indigo-300 mb-4')
+            ui.label('Libre AI Assistant').classes('text-2xl font-bold text-gray-600')
+            ui.label('Ask me to find books or help with your studies.').classes('text-gray-400')
+        return column
+
+    def add_message(msg):
+        """Show a new message at the bottom and scroll to it. Returns its markdown element."""
+        if state['empty_state'] is not None:
+            state['empty_state'].delete()
+            state['empty_state'] = None
+        with messages_column:
+            _, content = message_row(msg)
+        scroll.scroll_to(percent=1)
+        return content
+
+    async def load_older():
+        """Put the previous window of messages above the oldest one on screen."""
+        if state['loading_older'] or not state['older']: return
+        state['loading_older'] = True
+        try:
+            messages, state['start'], state['older'] = \
+                await chats.load_older(username, state['current_chat_id'], state['start'])
+            anchor = next((c for c in messages_column if c is not older_button), None)
+            with messages_column:
+                for i, msg in enumerate(messages):
+                    message_row(msg)[0].move(messages_column, target_index=1 + i)
+            older_button.set_visibility(state['older'])
+            # Keep the message that was at the top where it was, instead of jumping to the oldest
+            if anchor is not None:
+                ui.run_javascript(f'setTimeout(() => document.getElementById("c{anchor.id}")?.scrollIntoView(), 50)')
+        finally:
+            state['loading_older'] = False
+
+    async def on_scroll_top():
+        if state['older']:
+            await load_older()
+
+    async def stream_reply(question):
+        """Let the model answer in a new bubble, drawing it as the text arrives."""
+        passages = await run.io_bound(vector_index.search, question)
+        history = state['messages'][:-1][-HISTORY_MESSAGES:]
+        content = add_message({'text': '...', 'is_user': False})
+
+        reply, drawn = '', 0.0
+        try:
+            # aclosing: leaving early closes the stream, and with it the model's response
+            async with aclosing(llm.backend.stream(build_prompt(history, question, passages))) as stream:
+                async for piece in stream:
+                    reply += piece
+                    if content.is_deleted: break  # the page was closed
+                    if time.monotonic() - drawn >= STREAM_INTERVAL:
+                        content.set_content(reply)
+                        scroll.scroll_to(percent=1)
+                        drawn = time.monotonic()
+        except llm.LLMError:
+            if reply:
+                reply += "\n\n*(The answer was cut off.)*"
+            else:
+                # No model available right now: answer the way we do without one
+                passages = []
+                reply = await run.io_bound(library_reply, question)
+        if passages:
+            reply += "\n\n" + sources(passages)
+        content.set_content(reply)
+        scroll.scroll_to(percent=1)
+        return reply
 
     async def send_message():
         text = text_input.value.strip()
-        if not text: return
+        if not text or state['replying']: return
+        # One question at a time: set before the first await, so a second Enter
+        # during the save below can't start another answer next to this one
+        state['replying'] = True
         text_input.value = ''
-        
-        # 1. User Message
-        state['messages'].append({
-            'text': text, 
-            'is_user': True, 
-            'timestamp': datetime.now().strftime("%H:%M")
-        })
-        save_current_chat() 
-        chat_area.refresh()
-        
-        # 2. AI Processing
-        response = "I'm just a demo bot right now."
-        
-        # --- SIMPLE BRAIN LOGIC ---
-        clean_text = text.lower()
-        if "find" in clean_text or "search" in clean_text or "books about" in clean_text:
-            # Extract search term (very basic)
-            search_term = text.replace("find", "").replace("search", "").replace("books about", "").strip()
-            
-            if len(search_term) < 2:
-                response = "What topic should I search for? (e.g., 'Find Python')"
+        try:
+            # 1. User Message
+            message = {
+                'text': text, 
+                'is_user': True, 
+                'timestamp': datetime.now().strftime("%H:%M")
+            }
+            add_message(message)
+            await save_message(message)
+
+            # 2. AI Processing
+            if llm.backend is not None and not is_search_request(text):
+                response = await stream_reply(text)
             else:
-                results = search_library(search_term)
-                if results:
-                    book_list = "\n".join([f"- **{t}**" for t in results[:5]])
-                    response = f"I found these books matching '{search_term}':\n\n{book_list}"
-                    if len(results) > 5: response += "\n\n(and more...)"
-                else:
-                    response = f"I couldn't find any books about '{search_term}' in the library."
-        else:
-            response = "I can help you find resources. Try saying 'Find books about Biology'."
-
-        ui.timer(0.8, lambda: finalize_response(response), once=True)
-
-    def finalize_response(response_text):
-        state['messages'].append({
-            'text': response_text, 
-            'is_user': False, 
-            'timestamp': datetime.now().strftime("%H:%M")
-        })
-        save_current_chat()
-        chat_area.refresh()
+                response = await run.io_bound(library_reply, text)
+                add_message({'text': response, 'is_user': False})
+
+            await save_message({
+                'text': response, 
+                'is_user': False, 
+                'timestamp': datetime.now().strftime("%H:%M")
+            })
+        finally:
+            state['replying'] = False
 
     # --- 4. START ---
-    load_current_chat()
+    await load_current_chat()
 
     with ui.column().classes('w-full h-[calc(100vh-64px)] bg-gray-50 relative'):
-        with ui.scroll_area().classes('w-full h-full pb-24 px-4 pt-8'):
-            with ui.column().classes('w-full max-w-4xl mx-auto'):
-                chat_area()
+        # The browser decides whether the top was reached, so scrolling through a
+        # chat doesn't make a round trip to the server for every step
+        with ui.scroll_area().classes('w-full h-full pb-24 px-4 pt-8') \
+                .on('scroll', on_scroll_top, throttle=0.2,
+                    js_handler='(e) => { if (e.verticalPosition < 40) emit() }') as scroll:
+            with ui.column().classes('w-full max-w-4xl mx-auto') as messages_column:
+                older_button = ui.button('Load earlier messages', icon='expand_less', on_click=load_older) \
+                    .props('flat dense no-caps color=grey').classes('self-center text-xs')
+                older_button.set_visibility(state['older'])
+                if not state['messages']:
+                    state['empty_state'] = empty_state()
+                for msg in state['messages']:
+                    message_row(msg)
 
         with ui.row().classes('w-full absolute bottom-6 px-4 justify-center'):
             with ui.row().classes('w-full max-w-3xl bg-white rounded-full shadow-xl border border-gray-200 items-center px-2 py-2'):
@@ -194,5 +290,8 @@ def chat_page(chat_id: str = None):
                     .on('keydown.enter', send_message)
                 ui.button(icon='send', on_click=send_message).props('unelevated round color=indigo-600')
 
+    # Open at the latest message
+    ui.timer(0, lambda: scroll.scroll_to(percent=1), once=True)
+
 if __name__ in {"__main__", "__mp_main__"}:
     ui.run(storage_secret='super_secret_key_123')
\ No newline at end of file
@@ -1,61 +1,40 @@
-import json
 import random
-from pathlib import Path
-from nicegui import ui, app
+from nicegui import ui, app, run
 from components.header import header
 from components.sidebar import sidebar
-
-# --- CONFIGURATION ---
-BASE_DIR = Path(__file__).parent.parent
-BOOKS_DIR = BASE_DIR / 'data' / 'books'
-USERS_DIR = BASE_DIR / 'data' / 'users'
+from services.catalog import catalog
+from services.progress import progress_store
+from services.thumbnails import cover_url
 
 # --- DATA HELPERS ---
 def load_books():
-    books = []
-    if not BOOKS_DIR.exists(): return books
-    for book_dir in BOOKS_DIR.iterdir():
-        if not book_dir.is_dir(): continue
-        try:
-            with open(book_dir / 'metadata.json', 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                if 'id' not in data: data['id'] = book_dir.name
-                books.append(data)
-        except: continue
-    return books
+    return catalog.all()
 
-def get_last_read_book(all_books):
+async def get_last_read_book():
     """Finds the last book the logged-in user interacted with."""
     if not app.storage.user.get('authenticated'): return None
     
-    username = app.storage.user.get('username')
-    safe_name = "".join([c for c in username if c.isalpha() or c.isdigit()])
-    history_file = USERS_DIR / safe_name / 'reading_history.json'
-    
-    if not history_file.exists(): return None
+    # The first lookup per user reads their history file
+    last = await run.io_bound(progress_store.last_read, app.storage.user.get('username'))
+    if not last: return None
+    last_book_id, last_page = last
     
-    try:
-        with open(history_file, 'r') as f:
-            history = json.load(f)
-            if not history: return None
-            last_book_id = list(history.keys())[-1]
-            last_page = history[last_book_id]
-            
-            for b in all_books:
-                if str(b['id']) == last_book_id:
-                    b['last_page'] = last_page
-                    return b
-    except: return None
+    book = catalog.get(last_book_id)
+    if book:
+        # Copy, the catalog's dicts are shared between all visitors
+        book = dict(book)
+        book['last_page'] = last_page
+        return book
     return None
 
 @ui.page('/')
-def home_page():
+async def home_page():
     all_books = load_books()
     user = app.storage.user
     is_logged_in = user.get('authenticated', False)
     first_name = user.get('first_name', 'Guest')
     
-    last_read = get_last_read_book(all_books)
+    last_read = await get_last_read_book()
 
     nav = sidebar()
     header(nav)
@@ -78,7 +57,7 @@ def home_page():
                 ui.label('JUMP BACK IN').classes('px-6 pt-6 text-xs font-bold text-gray-400 tracking-widest')
                 
                 if last_read:
-                    cover = last_read.get('formats', {}).get('image/jpeg')
+                    cover = cover_url(last_read, 'sm')
                     title = last_read.get('title', 'Untitled')
                     page = last_read.get('last_page', 0) + 1
                     
@@ -129,7 +108,7 @@ def home_page():
                     display_books = random.sample(all_books, min(len(all_books), 8))
                     
                     for book in display_books:
-                        cover = book.get('formats', {}).get('image/jpeg')
+                        cover = cover_url(book, 'sm')
                         
                         # --- SIZE UPDATE HERE ---
                         # Changed w-40 h-64 -> w-32 h-48 (Smaller cards)
@@ -1,8 +1,9 @@
-import json
 import hashlib
 import os
 from pathlib import Path
 from nicegui import ui, app
+from services import storage
+from services.static import versioned
 
 # --- CONFIGURATION ---
 BASE_DIR = Path(__file__).parent.parent
@@ -18,22 +19,18 @@ def get_user_file(username: str) -> Path:
 def hash_password(password: str) -> str:
     return hashlib.sha256(password.encode()).hexdigest()
 
-def verify_user(username, password):
+async def verify_user(username, password):
     file_path = get_user_file(username)
-    if not file_path.exists():
-        return None
-    try:
-        with open(file_path, 'r') as f:
-            user_data = json.load(f)
-            if user_data.get('password') == hash_password(password):
-                return user_data 
-            return None
-    except:
+    user_data = await storage.read_json(file_path)
+    if not isinstance(user_data, dict):
         return None
+    if user_data.get('password') == hash_password(password):
+        return user_data 
+    return None
 
-def create_user(username, password, first_name, last_name, role, extra_data):
+async def create_user(username, password, first_name, last_name, role, extra_data):
     file_path = get_user_file(username)
-    if file_path.exists():
+    if await storage.exists(file_path):
         return False 
     
     user_data = {
@@ -46,8 +43,7 @@ def create_user(username, password, first_name, last_name, role, extra_data):
         'created_at': str(os.path.getctime(USERS_DIR)) if USERS_DIR.exists() else ""
     }
     
-    with open(file_path, 'w') as f:
-        json.dump(user_data, f, indent=2)
+    await storage.write_json(file_path, user_data, indent=2)
     return True
 
 # --- RESPONSIVE UI PAGE ---
@@ -81,7 +77,7 @@ def login_page():
             
             # LOGO IMAGE
             # Mobile: Small (w-10), Desktop: Large (w-64)
-            ui.image('/assets/login-page.png').classes('w-10 md:w-64 drop-shadow-md')
+            ui.image(versioned('/assets/login-page.png', ASSETS_DIR / 'login-page.png')).classes('w-10 md:w-64 drop-shadow-md')
 
             # TEXT CONTAINER
             # Mobile: No extra spacing, Desktop: Pulse animation
@@ -174,7 +170,7 @@ def login_page():
                     if is_registering: reg_container.classes(remove='hidden')
                     else: reg_container.classes(add='hidden')
 
-                def handle_submit():
+                async def handle_submit():
                     username = username_input.value.strip()
                     password = password_input.value.strip()
                     
@@ -196,13 +192,13 @@ def login_page():
                                 ui.notify('Missing rank details', color='warning'); return
                             extra_data = {'rank': rank_select.value}
                         
-                        if create_user(username, password, fname, lname, role, extra_data):
+                        if await create_user(username, password, fname, lname, role, extra_data):
                             ui.notify(f'Account created! Welcome, {fname}.', color='positive', icon='check')
                             toggle_mode()
                         else:
                             ui.notify('Username already taken', color='negative', icon='error')
                     else:
-                        user = verify_user(username, password)
+                        user = await verify_user(username, password)
                         if user:
                             # Save to session
                             app.storage.user['username'] = user['username']
@@ -1,9 +1,9 @@
-import json
 import hashlib
 from pathlib import Path
 from nicegui import ui, app
 from components.header import header
 from components.sidebar import sidebar
+from services import storage
 
 # --- CONFIGURATION ---
 BASE_DIR = Path(__file__).parent.parent
@@ -18,7 +18,7 @@ def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
 
 @ui.page('/profile')
-def profile_page():
+async def profile_page():
     if not app.storage.user.get('authenticated'): return ui.navigate.to('/login')
 
     nav = sidebar()
@@ -28,10 +28,7 @@ def profile_page():
     username = app.storage.user.get('username')
     user_file = get_user_file(username)
     
-    current_data = {}
-    if user_file.exists():
-        with open(user_file, 'r') as f:
-            current_data = json.load(f)
+    current_data = await storage.read_json(user_file, {})
             
     # State for Inputs
     state = {
@@ -41,23 +38,23 @@ def profile_page():
         'bio': current_data.get('details', {}).get('bio', '')
     }
 
-    def save_changes():
-        # Update Data Object
-        current_data['first_name'] = state['first_name']
-        current_data['last_name'] = state['last_name']
-        
-        # Only update details if they exist, carefully preserving role info
-        if 'details' not in current_data: current_data['details'] = {}
-        current_data['details']['bio'] = state['bio']
-        
-        # Only update password if typed
-        if state['password']:
-            current_data['password'] = hash_password(state['password'])
+    async def save_changes():
+        # Update Data Object (the copy on disk, another tab may have saved since this page loaded)
+        def apply(data):
+            data['first_name'] = state['first_name']
+            data['last_name'] = state['last_name']
+            
+            # Only update details if they exist, carefully preserving role info
+            if 'details' not in data: data['details'] = {}
+            data['details']['bio'] = state['bio']
+            
+            # Only update password if typed
+            if state['password']:
+                data['password'] = hash_password(state['password'])
             
         # Save to Disk
         try:
-            with open(user_file, 'w') as f:
-                json.dump(current_data, f, indent=2)
+            await storage.update_json(user_file, apply, {}, indent=2)
             
             # Update Session
             app.storage.user['first_name'] = state['first_name']
@@ -1,89 +1,47 @@
-import re
-import json
-from pathlib import Path
-from nicegui import ui, app
+from nicegui import ui, app, run
 from pages.book.book_details import load_book
-
-# --- CONFIGURATION ---
-CHUNK_SIZE = 3000
-BASE_DIR = Path(__file__).resolve().parent.parent.parent
-USERS_DIR = BASE_DIR / 'data' / 'users'
-
-# --- HELPER: TEXT CLEANING ---
-def clean_text(text):
-    if not text: return ""
-    text = re.sub(r'(?<!\n)\n(?!\n)', ' ', text)
-    text = re.sub(r' +', ' ', text)
-    return text
+from services.pager import get_page_table, read_page
+from services.progress import progress_store
 
 # --- HELPER: PROGRESS MANAGEMENT ---
-def get_progress_file():
+# Progress lives in memory and is flushed to disk in the background (see services.progress)
+async def load_saved_page(book_id):
     if not app.storage.user.get('authenticated'):
-        return None
-        
-    username = app.storage.user.get('username')
-    safe_name = "".join([c for c in username if c.isalpha() or c.isdigit()])
-    user_dir = USERS_DIR / safe_name
-    user_dir.mkdir(parents=True, exist_ok=True)
-    return user_dir / 'reading_history.json'
-
-def load_saved_page(book_id):
-    p_file = get_progress_file()
-    if not p_file or not p_file.exists():
-        return 0
-        
-    try:
-        with open(p_file, 'r') as f:
-            history = json.load(f)
-            return history.get(str(book_id), 0)
-    except:
         return 0
+    # The first lookup per user reads their history file, so keep it off the event loop
+    return await run.io_bound(progress_store.get_page, app.storage.user.get('username'), book_id)
 
 def save_current_page(book_id, page_num):
     """Saves the current page number and moves book to end of list."""
-    p_file = get_progress_file()
-    if not p_file: return
-    
-    history = {}
-    if p_file.exists():
-        try:
-            with open(p_file, 'r') as f:
-                history = json.load(f)
-        except:
-            history = {}
-            
-    # --- THE FIX IS HERE ---
-    # We delete the key if it exists, then re-add it.
-    # This forces Python to move this book to the END of the dictionary.
-    if str(book_id) in history:
-        del history[str(book_id)]
-        
-    history[str(book_id)] = page_num
-    
-    with open(p_file, 'w') as f:
-        json.dump(history, f)
+    if not app.storage.user.get('authenticated'):
+        return
+    progress_store.record(app.storage.user.get('username'), book_id, page_num)
 
 # --- MAIN PAGE ---
 
 @ui.page('/read/{book_id}')
-def reader_page(book_id: str):
+async def reader_page(book_id: str, page: int = None):
     # 1. Load Book
-    book = load_book(book_id)
+    book = await load_book(book_id)
     if not book:
         ui.label('Book not found').classes('text-xl text-red-500 p-8')
         return
 
-    raw_content = book.get('content', '')
-    full_content = clean_text(raw_content)
-    total_chars = len(full_content)
-    total_pages = (total_chars + CHUNK_SIZE - 1) // CHUNK_SIZE if total_chars > 0 else 1
+    # Only the page offsets are kept per book, pages are read from disk on demand.
+    # Building the table streams the whole file once, so keep it off the event loop.
+    page_table = await run.io_bound(get_page_table, book_id)
+    total_pages = max(1, len(page_table))
     
-    # 2. Load History
-    start_page = load_saved_page(book_id)
+    # 2. Load History (a link to a page, e.g. from the chatbot, opens that page instead)
+    if page is not None:
+        start_page = min(max(page - 1, 0), total_pages - 1)
+    else:
+        start_page = min(await load_saved_page(book_id), total_pages - 1)
     
     # 3. State
     state = {
         'page': start_page,
+        'chunk': await run.io_bound(read_page, book_id, start_page),
         'font_size': 18,
         'theme': 'sepia', 
     }
@@ -97,11 +55,7 @@ def reader_page(book_id: str):
     # 4. Render
     @ui.refreshable
     def render_content():
-        if state['page'] >= total_pages: state['page'] = total_pages - 1
-        
-        start = state['page'] * CHUNK_SIZE
-        end = start + CHUNK_SIZE
-        chunk = full_content[start:end]
+        chunk = state['chunk']
         progress = (state['page'] + 1) / total_pages
         win_bg, paper_bg, text_col = themes[state['theme']]
 
@@ -157,19 +111,20 @@ def reader_page(book_id: str):
                             .props('flat dense no-caps text-color=green icon-right=check')
 
     # 5. Handlers
-    def next_page():
+    async def go_to_page(page):
+        state['chunk'] = await run.io_bound(read_page, book_id, page)
+        state['page'] = page
+        save_current_page(book_id, state['page'])
+        render_content.refresh()
+        ui.run_javascript('window.scrollTo(0, 0)')
+
+    async def next_page():
         if state['page'] < total_pages - 1:
-            state['page'] += 1
-            save_current_page(book_id, state['page'])
-            render_content.refresh()
-            ui.run_javascript('window.scrollTo(0, 0)')
+            await go_to_page(state['page'] + 1)
 
-    def prev_page():
+    async def prev_page():
         if state['page'] > 0:
-            state['page'] -= 1
-            save_current_page(book_id, state['page'])
-            render_content.refresh()
-            ui.run_javascript('window.scrollTo(0, 0)')
+            await go_to_page(state['page'] - 1)
 
     def update_font(size):
         state['font_size'] = max(12, min(32, size))
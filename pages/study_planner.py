@@ -2,8 +2,8 @@ from nicegui import ui
 from components.header import header
 from components.sidebar import sidebar
 from datetime import datetime, timedelta
-import json
 from pathlib import Path
+from services import storage
 
 # --- CONFIGURATION ---
 BASE_DIR = Path(__file__).parent.parent
@@ -16,7 +16,7 @@ TASKS_FILE = TASKS_DIR / 'tasks.json'
 TASKS_DIR.mkdir(parents=True, exist_ok=True)
 
 @ui.page('/planner')
-def planner_page():
+async def planner_page():
     # NEW WAY (Connects them together)
     nav = sidebar()  # 1. Create Sidebar first
     header(nav)      # 2. Pass it to Header
@@ -56,10 +56,9 @@ def planner_page():
 
     # --- 3. HELPER FUNCTIONS ---
 
-    def save_tasks():
+    async def save_tasks():
         try:
-            with open(TASKS_FILE, 'w') as f:
-                json.dump(tasks, f)
+            await storage.write_json(TASKS_FILE, tasks)
         except Exception as e:
             ui.notify(f"Error saving tasks: {str(e)}", color='negative')
 
@@ -83,15 +82,15 @@ def planner_page():
                         ui.button(icon='delete', on_click=lambda t=task: delete_task(t))\
                             .props('flat dense color=red').classes('opacity-50 hover:opacity-100')
 
-    def toggle_task_complete(task, is_completed):
+    async def toggle_task_complete(task, is_completed):
         task['completed'] = is_completed
-        save_tasks()
+        await save_tasks()
         update_tasks_display()
 
-    def delete_task(task):
+    async def delete_task(task):
         if task in tasks:
             tasks.remove(task)
-            save_tasks()
+            await save_tasks()
             update_tasks_display()
 
     def add_message(text, is_user=False):
@@ -105,21 +104,21 @@ def planner_page():
                     ui.label(datetime.now().strftime('%I:%M %p')).classes(f'text-xs text-gray-500 {text_align}')
         chat_scroll.scroll_to(percent=100)
 
-    def handle_message():
+    async def handle_message():
         text = message_input.value.strip()
         if not text: return
         add_message(text, is_user=True)
         message_input.value = ""
-        process_command(text)
+        await process_command(text)
 
-    def process_command(text):
+    async def process_command(text):
         text = text.lower()
         if text in ['hi', 'hello', 'hey']:
             add_message("Hello! How can I help you with your studies today?")
         elif 'add task' in text:
             task_name = text.replace('add task', '').strip()
             if task_name:
-                add_new_task(task_name)
+                await add_new_task(task_name)
                 add_message(f"I've added '{task_name}' to your list.")
             else:
                 add_message("Please specify a task name. E.g., 'add task Read Chapter 1'")
@@ -132,7 +131,7 @@ def planner_page():
         else:
             add_message("I didn't quite catch that. Try 'add task [name]' or 'show tasks'.")
 
-    def add_new_task(text, due=None):
+    async def add_new_task(text, due=None):
         if due is None:
             due = (datetime.now() + timedelta(days=7)).strftime('%Y-%m-%d')
         
@@ -143,18 +142,14 @@ def planner_page():
             'completed': False
         }
         tasks.append(new_task)
-        save_tasks()
+        await save_tasks()
         update_tasks_display()
 
     # --- 4. INITIALIZATION ---
     
     # Load tasks from file
-    if TASKS_FILE.exists():
-        try:
-            with open(TASKS_FILE, 'r') as f:
-                tasks = json.load(f)
-        except:
-            tasks = []
+    saved_tasks = await storage.read_json(TASKS_FILE, [])
+    if isinstance(saved_tasks, list): tasks.extend(saved_tasks)
     
     # Connect handlers
     message_input.on('keydown.enter', handle_message)
@@ -168,10 +163,10 @@ def planner_page():
             d_date = ui.date(value=datetime.now().strftime('%Y-%m-%d')).classes('w-full')
             with ui.row().classes('w-full justify-end'):
                 ui.button('Cancel', on_click=add_dialog.close).props('flat')
-                ui.button('Add', on_click=lambda: [
-                    add_new_task(d_input.value, d_date.value), 
+                async def add_from_dialog():
+                    await add_new_task(d_input.value, d_date.value)
                     add_dialog.close()
-                ])
+                ui.button('Add', on_click=add_from_dialog)
     
     add_task_btn.on('click', add_dialog.open)
 
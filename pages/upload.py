@@ -1,15 +1,19 @@
 import uuid
-import json
 from pathlib import Path
 from nicegui import ui, app, events
 from components.header import header
 from components.sidebar import sidebar
+from services import blobs, storage, uploads
+from services.ingest import ingest_queue
 
 # --- CONFIGURATION ---
 BASE_DIR = Path(__file__).parent.parent
 BOOKS_DIR = BASE_DIR / 'data' / 'books'
 BOOKS_DIR.mkdir(parents=True, exist_ok=True)
 
+MAX_DOCUMENT_BYTES = 250 * 1024 * 1024
+MAX_COVER_BYTES = 10 * 1024 * 1024
+
 @ui.page('/upload')
 def upload_page():
     # Security: Require Login
@@ -25,39 +29,59 @@ def upload_page():
         'author': '',
         'category': 'Uncategorized',
         'description': '',
-        # We store the raw bytes and filename strings immediately
-        'cover_data': None,   
+        # Uploads are streamed to temp files right away; only their paths live here
+        'cover_file': None,   
         'cover_name': None,
-        'content_data': None, 
+        'cover_hash': None,
+        'content_file': None, 
         'content_name': None,
+        'content_hash': None,
         'uploading': False
     }
 
     # --- HELPERS ---
-    def handle_cover_upload(e: events.UploadEventArguments):
-        # 1. Capture data immediately
-        state['cover_data'] = e.content.read()
-        # 2. Capture name safely
-        state['cover_name'] = e.name 
-        ui.notify(f'Cover ready: {e.name}', color='positive')
+    async def receive(e: events.UploadEventArguments, kind: str, max_bytes: int):
+        """Take over a received upload, replacing any earlier file of the same kind."""
+        try:
+            temp, digest = await uploads.receive(e.file, max_bytes)
+        except uploads.UploadTooLarge as error:
+            ui.notify(str(error), color='negative')
+            return False
+        await uploads.discard(state[f'{kind}_file'])
+        state[f'{kind}_file'] = temp
+        state[f'{kind}_name'] = Path(e.file.name).name
+        state[f'{kind}_hash'] = digest
+        return True
+
+    async def handle_cover_upload(e: events.UploadEventArguments):
+        if await receive(e, 'cover', MAX_COVER_BYTES):
+            ui.notify(f'Cover ready: {e.file.name}', color='positive')
         
-    def handle_content_upload(e: events.UploadEventArguments):
-            # DEBUG: Print to terminal to prove this function ran
-            print(f"DEBUG: Handler started for {e.name}") 
-            
-            state['content_data'] = e.content.read()
-            state['content_name'] = e.name
-            
-            print(f"DEBUG: Data saved. Size: {len(state['content_data'])} bytes")
-            ui.notify(f'File ready: {e.name}', color='positive')
-
-    def save_resource():
+    async def handle_content_upload(e: events.UploadEventArguments):
+        if await receive(e, 'content', MAX_DOCUMENT_BYTES):
+            existing = blobs.find_book(state['content_hash'])
+            if existing:
+                # Saving still works (it shares the stored copy), but it's most likely not wanted
+                ui.notify(f"This file is already in the library as '{existing.get('title', 'Untitled')}'",
+                          color='warning')
+            else:
+                ui.notify(f'File ready: {e.file.name}', color='positive')
+
+    async def discard_uploads():
+        await uploads.discard(state['cover_file'])
+        await uploads.discard(state['content_file'])
+
+    # Files that were uploaded but never saved shouldn't outlive the page; not
+    # on_disconnect, which also fires for a network blip the client recovers from
+    ui.context.client.on_delete(discard_uploads)
+
+    async def save_resource():
         # Validation
         if not state['title'] or not state['author']:
             ui.notify('Title and Author are required', color='warning')
             return
         
-        if not state['content_data']:
+        if not state['content_file']:
             ui.notify('Please upload a document file', color='warning')
             return
 
@@ -68,22 +92,21 @@ def upload_page():
             # 1. Generate Unique ID & Folder
             book_id = str(uuid.uuid4())
             book_dir = BOOKS_DIR / book_id
-            book_dir.mkdir(parents=True, exist_ok=True)
 
-            # 2. Save Content File (Using the string we saved earlier)
+            # 2. Save Content File (a link to the stored blob, which is shared by identical uploads)
             content_filename = state['content_name'] 
             content_path = book_dir / content_filename
             
-            with open(content_path, 'wb') as f:
-                f.write(state['content_data'])
+            await blobs.store(state['content_file'], state['content_hash'], content_path)
+            state['content_file'] = None
 
             # 3. Save Cover Image (If exists)
             cover_filename = None
-            if state['cover_data']:
+            if state['cover_file']:
                 ext = Path(state['cover_name']).suffix
                 cover_filename = f"cover{ext}"
-                with open(book_dir / cover_filename, 'wb') as f:
-                    f.write(state['cover_data'])
+                await blobs.store(state['cover_file'], state['cover_hash'], book_dir / cover_filename)
+                state['cover_file'] = None
 
             # 4. Generate Metadata
             metadata = {
@@ -94,6 +117,7 @@ def upload_page():
                 "summaries": [state['description'] if state['description'] else "No description provided."],
                 "languages": ["en"],
                 "download_count": 0,
+                "content_sha256": state['content_hash'],
                 "formats": {
                     "application/octet-stream": content_filename, 
                 }
@@ -102,9 +126,11 @@ def upload_page():
             if cover_filename:
                 metadata["formats"]["image/jpeg"] = f"/covers/{book_id}/{cover_filename}"
 
-            # 5. Write Metadata File
-            with open(book_dir / 'metadata.json', 'w') as f:
-                json.dump(metadata, f, indent=2)
+            # 5. Write Metadata File (last, so the catalog only sees complete books)
+            await storage.write_json(book_dir / 'metadata.json', metadata, indent=2)
+
+            # 6. Extraction, page and search indexes and thumbnails run in the background
+            await ingest_queue.submit(book_id)
 
             loading_dialog.close()
             ui.notify('Upload successful!', color='green')
@@ -142,7 +168,9 @@ def upload_page():
                     with ui.column().classes('flex-1 min-w-[250px]'):
                         ui.label('Document File (PDF, DOCX, EPUB)').classes('font-bold text-gray-600')
                         # auto_upload=True ensures we catch the file immediately
-                        ui.upload(on_upload=handle_content_upload, auto_upload=True, max_files=1) \
+                        ui.upload(on_upload=handle_content_upload, auto_upload=True, max_files=1,
+                                  max_file_size=MAX_DOCUMENT_BYTES,
+                                  on_rejected=lambda: ui.notify('That file is too large', color='negative')) \
                             .props('accept=".pdf,.epub,.docx,.ppt,.pptx,.txt" flat bordered') \
                             .classes('w-full')
                         ui.label('Required').classes('text-xs text-red-400')
@@ -150,7 +178,9 @@ def upload_page():
                     # 2. Cover Image Upload
                     with ui.column().classes('flex-1 min-w-[250px]'):
                         ui.label('Cover Image').classes('font-bold text-gray-600')
-                        ui.upload(on_upload=handle_cover_upload, auto_upload=True, max_files=1) \
+                        ui.upload(on_upload=handle_cover_upload, auto_upload=True, max_files=1,
+                                  max_file_size=MAX_COVER_BYTES,
+                                  on_rejected=lambda: ui.notify('That image is too large', color='negative')) \
                             .props('accept="image/*" flat bordered') \
                             .classes('w-full')
                         ui.label('Optional').classes('text-xs text-gray-400')
@@ -0,0 +1,150 @@
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Optional
+
+from services.text import CHUNK_SIZE, display_text, iter_clean
+
+# --- CONFIGURATION ---
+BASE_DIR = Path(__file__).resolve().parent.parent
+BOOKS_DIR = BASE_DIR / 'data' / 'books'
+
+# Bump whenever the cleaning rules or the file layout change, to force rebuilds
+ARTIFACT_VERSION = 1
+
+# Derived files, written next to each book's content.txt
+CLEAN_NAME = 'content.clean.txt'     # clean_text() of content.txt, UTF-8
+PAGES_NAME = 'content.pages.json'    # source fingerprint + byte offset of every page
+
+_build_locks: Dict[str, threading.Lock] = defaultdict(threading.Lock)
+
+def content_path(book_id: str) -> Path:
+    return BOOKS_DIR / str(book_id) / 'content.txt'
+
+def file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _write_atomic(target: Path, write):
+    """Write through a temp file in the same folder, then swap it in."""
+    fd, temp = tempfile.mkstemp(dir=target.parent, prefix=f'.{target.name}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(temp, target)
+    except BaseException:
+        Path(temp).unlink(missing_ok=True)
+        raise
+
+# --- BUILDING ---
+def build(book_id: str, source_hash: Optional[str] = None) -> Dict:
+    """Write the cleaned text and page index of one book. Returns the new manifest."""
+    book_dir = BOOKS_DIR / str(book_id)
+    source = book_dir / 'content.txt'
+    stat = source.stat()
+    pages, chars = [], 0
+
+    def write_clean(f):
+        nonlocal chars
+        written = 0
+        for _, text, _ in iter_clean(source):
+            # Record the byte offset of every CHUNK_SIZE'th character as it streams past
+            while len(pages) * CHUNK_SIZE < chars + len(text):
+                i = len(pages) * CHUNK_SIZE - chars
+                pages.append(written + len(text[:i].encode('utf-8', 'surrogateescape')))
+            data = text.encode('utf-8', 'surrogateescape')
+            f.write(data)
+            written += len(data)
+            chars += len(text)
+
+    _write_atomic(book_dir / CLEAN_NAME, write_clean)
+
+    manifest = {
+        'version': ARTIFACT_VERSION,
+        'chunk_size': CHUNK_SIZE,
+        'source': {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha256': source_hash or file_hash(source),
+        },
+        'chars': chars,
+        'pages': pages,
+    }
+    _write_atomic(book_dir / PAGES_NAME, lambda f: f.write(json.dumps(manifest).encode('utf-8')))
+    return manifest
+
+def read_manifest(book_id: str) -> Optional[Dict]:
+    try:
+        with open(BOOKS_DIR / str(book_id) / PAGES_NAME, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def ensure(book_id: str) -> Optional[Dict]:
+    """
+    Return the manifest of a book's artifacts, (re)building them only if
+    content.txt changed since. Returns None for books without content.txt.
+
+    A matching size and mtime is trusted as is; if only the mtime moved
+    (a copy or a touch), the hash decides whether a rebuild is needed.
+    """
+    book_id = str(book_id)
+    try:
+        stat = content_path(book_id).stat()
+    except OSError:
+        return None
+
+    with _build_locks[book_id]:
+        manifest = read_manifest(book_id)
+        usable = (manifest is not None
+                  and manifest.get('version') == ARTIFACT_VERSION
+                  and manifest.get('chunk_size') == CHUNK_SIZE
+                  and (BOOKS_DIR / book_id / CLEAN_NAME).exists())
+        if usable:
+            source = manifest['source']
+            if (source['size'], source['mtime_ns']) == (stat.st_size, stat.st_mtime_ns):
+                return manifest
+            if source['size'] == stat.st_size:
+                source_hash = file_hash(content_path(book_id))
+                if source_hash == source['sha256']:
+                    # Same bytes, just a new timestamp: refresh the fingerprint only
+                    source['mtime_ns'] = stat.st_mtime_ns
+                    _write_atomic(BOOKS_DIR / book_id / PAGES_NAME,
+                                  lambda f: f.write(json.dumps(manifest).encode('utf-8')))
+                    return manifest
+                return build(book_id, source_hash)
+        return build(book_id)
+
+# --- READING ---
+def read_range(book_id: str, start: int, end: Optional[int] = None) -> str:
+    """Read bytes [start, end) of the cleaned text, as display text."""
+    with open(BOOKS_DIR / str(book_id) / CLEAN_NAME, 'rb') as f:
+        f.seek(start)
+        data = f.read() if end is None else f.read(max(0, end - start))
+    return display_text(data.decode('utf-8', 'surrogateescape'))
+
+def read_preview(book_id: str, chars: int = 1000) -> str:
+    """The first `chars` characters of the cleaned text, without reading the rest."""
+    manifest = ensure(book_id)
+    if manifest is None: return ''
+    pages = manifest['pages']
+    # A page is CHUNK_SIZE characters, so the first pages that cover `chars` are enough
+    end = pages[chars // CHUNK_SIZE + 1] if chars // CHUNK_SIZE + 1 < len(pages) else None
+    return read_range(book_id, 0, end)[:chars]
+
+# --- BUILD STEP ---
+# python -m services.artifacts          build missing or stale artifacts for every book
+# python -m services.artifacts 84 1342  just these books
+if __name__ == '__main__':
+    book_ids = sys.argv[1:] or [p.name for p in BOOKS_DIR.iterdir() if p.is_dir()]
+    for book_id in book_ids:
+        manifest = ensure(book_id)
+        print(book_id, f"{len(manifest['pages'])} pages" if manifest else 'no content.txt')
@@ -0,0 +1,99 @@
+import errno
+import os
+import shutil
+import sys
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from nicegui import app, run
+
+# --- CONFIGURATION ---
+BASE_DIR = Path(__file__).resolve().parent.parent
+BLOBS_DIR = BASE_DIR / 'data' / 'blobs'   # blobs/<first 2 hex digits>/<sha256>
+
+# Held while a blob may briefly have no references (between put and link)
+# so a concurrent garbage collection can't delete it from under an upload
+_lock = threading.Lock()
+
+def blob_path(digest: str) -> Path:
+    return BLOBS_DIR / digest[:2] / digest
+
+# --- STORING ---
+def _store(temp: Path, digest: str, target: Path) -> bool:
+    """
+    Move `temp` into the store under its hash (or drop it if that content
+    is already there) and hard-link the blob to `target`.
+    Returns True if the content was already stored.
+    """
+    blob = blob_path(digest)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    with _lock:
+        duplicate = blob.exists()
+        if duplicate:
+            temp.unlink(missing_ok=True)
+        else:
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            # Read-only, since every book linking to it shares the same inode
+            os.chmod(temp, 0o444)
+            os.replace(temp, blob)
+        # Linked (or copied) under a temporary name and then renamed over `target`:
+        # writing to an existing `target` would go through it into whatever
+        # blob it is already linked to, and corrupt every book sharing that
+        link = target.with_name(f'.{target.name}.tmp')
+        link.unlink(missing_ok=True)
+        try:
+            os.link(blob, link)
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK): raise
+            # No hard links here (another filesystem, FAT, ...): fall back to a private copy
+            shutil.copyfile(blob, link)
+        os.replace(link, target)
+    return duplicate
+
+async def store(temp: Path, digest: str, target: Path) -> bool:
+    return await run.io_bound(_store, temp, digest, target)
+
+# --- DUPLICATES ---
+def find_book(digest: str, field: str = 'content_sha256') -> Optional[Dict]:
+    """A book in the catalog whose upload had this hash, if any."""
+    from services.catalog import catalog
+    for book in catalog.all():
+        if book.get(field) == digest:
+            return book
+    return None
+
+# --- GARBAGE COLLECTION ---
+def collect_garbage() -> Tuple[int, int]:
+    """Delete blobs that no book links to any more. Returns (blobs removed, bytes freed)."""
+    removed = freed = 0
+    if not BLOBS_DIR.exists(): return removed, freed
+    for blob in BLOBS_DIR.glob('*/*'):
+        with _lock:
+            try:
+                stat = blob.stat()
+                if stat.st_nlink > 1: continue
+                blob.unlink()
+            except OSError:
+                continue
+        removed += 1
+        freed += stat.st_size
+    return removed, freed
+
+async def _collect_on_startup():
+    await run.io_bound(collect_garbage)
+
+app.on_startup(_collect_on_startup)
+
+# --- MAINTENANCE ---
+# python -m services.blobs         show how much the store saves
+# python -m services.blobs gc      delete unreferenced blobs
+if __name__ == '__main__':
+    if sys.argv[1:] == ['gc']:
+        removed, freed = collect_garbage()
+        print(f'{removed} blobs removed, {freed / 2**20:.1f} MB freed')
+    else:
+        blobs = list(BLOBS_DIR.glob('*/*')) if BLOBS_DIR.exists() else []
+        stored = sum(b.stat().st_size for b in blobs)
+        linked = sum(b.stat().st_size * max(0, b.stat().st_nlink - 1) for b in blobs)
+        print(f'{len(blobs)} blobs, {stored / 2**20:.1f} MB on disk for {linked / 2**20:.1f} MB of book files')
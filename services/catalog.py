@@ -0,0 +1,209 @@
+import json
+import logging
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+from nicegui import app, background_tasks, run
+from watchfiles import awatch
+
+from services import catalog_db
+
+# --- CONFIGURATION ---
+BASE_DIR = Path(__file__).resolve().parent.parent
+BOOKS_DIR = BASE_DIR / 'data' / 'books'
+
+# The watcher waits for this many ms of quiet (and at most WATCH_DEBOUNCE_MS)
+# before handing over a batch, so bulk imports turn into a few big updates
+WATCH_STEP_MS = 300
+WATCH_DEBOUNCE_MS = 2000
+
+log = logging.getLogger(__name__)
+
+# --- HELPER: METADATA PARSING ---
+def read_metadata(book_dir: Path) -> Optional[Dict]:
+    """Parse one book's metadata.json, filling in the fields the pages rely on."""
+    metadata_path = book_dir / 'metadata.json'
+    try:
+        with open(metadata_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if not isinstance(data, dict): return None
+    if 'id' not in data: data['id'] = book_dir.name
+    if 'subjects' not in data: data['subjects'] = ['Uncategorized']
+    return data
+
+def book_category(book: Dict) -> str:
+    """The tab a book is filed under: the first part of its first subject."""
+    cat = book.get('subjects', ['Uncategorized'])[0] if book.get('subjects') else 'Uncategorized'
+    return cat.split(' -- ')[0]
+
+def book_author(book: Dict) -> str:
+    authors = book.get('authors')
+    if isinstance(authors, list) and authors and isinstance(authors[0], dict):
+        return authors[0].get('name', 'Unknown')
+    return 'Unknown'
+
+# --- THE CATALOG ---
+class Catalog:
+    """
+    Process-wide, in-memory cache of every book's metadata.
+
+    Books are keyed by their folder name under data/books (the id used in
+    /book/{id} and /read/{id}). `version` goes up every time the contents
+    change, so pages can cache anything derived from the catalog and rebuild
+    it only when the number moves.
+
+    With a CatalogDB attached, startup reads the books from SQLite instead of
+    opening every metadata.json, and every change is written through to it.
+    """
+
+    def __init__(self, books_dir: Path, db: Optional[catalog_db.CatalogDB] = None):
+        self.books_dir = books_dir
+        self.db = db
+        self.version = 0
+        self._books: Dict[str, Dict] = {}
+        self._loaded = False
+        self._listeners: List[Callable[[List[str], List[str]], None]] = []
+
+    # --- LOADING ---
+    def load(self):
+        """(Re)scan the whole books folder, or read the database. Called once at startup."""
+        books = {}
+        if self.db is not None:
+            if not len(self.db):
+                self.db.import_books()  # first start: migrate the metadata.json files
+            books = self.db.load_all()
+        elif self.books_dir.exists():
+            for book_dir in self.books_dir.iterdir():
+                if not book_dir.is_dir(): continue
+                data = read_metadata(book_dir)
+                if data is not None:
+                    books[book_dir.name] = data
+
+        removed = [book_id for book_id in self._books if book_id not in books]
+        self._books = books
+        self._loaded = True
+        self._changed(list(books), removed)
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    # --- INCREMENTAL UPDATES ---
+    def _read_many(self, book_ids: Iterable[str]) -> Dict[str, Optional[Dict]]:
+        """Parse the metadata of the given books; None means the book is gone."""
+        parsed = {book_id: read_metadata(self.books_dir / book_id) for book_id in book_ids}
+        if self.db is not None:
+            self.db.store(parsed)
+        return parsed
+
+    async def reconcile(self):
+        """Pick up books that changed while the server was down (database mode only)."""
+        changed, removed = await run.io_bound(self.db.stale_ids)
+        if changed or removed:
+            self._apply(await run.io_bound(self._read_many, changed + removed))
+
+    def _apply(self, parsed: Dict[str, Optional[Dict]]):
+        """Patch the cache with freshly parsed metadata as a single change."""
+        updated, removed = [], []
+        for book_id, data in parsed.items():
+            if data is not None:
+                self._books[book_id] = data
+                updated.append(book_id)
+            elif self._books.pop(book_id, None) is not None:
+                removed.append(book_id)
+
+        if updated or removed:
+            self._changed(updated, removed)
+
+    async def refresh(self, book_ids: Iterable[str]):
+        """Re-read only the given books from disk (added, edited or deleted)."""
+        self._ensure_loaded()
+        parsed = await run.io_bound(self._read_many, {str(book_id) for book_id in book_ids})
+        if parsed is not None:
+            self._apply(parsed)
+
+    def _book_id_for(self, path: Path) -> Optional[str]:
+        """Map a changed path to the book it belongs to, ignoring unrelated files."""
+        if path.name == 'metadata.json' and path.parent.parent == self.books_dir:
+            return path.parent.name
+        if path.parent == self.books_dir:
+            return path.name  # a whole book folder was added or removed
+        return None
+
+    async def watch(self):
+        """Follow changes under the books folder and patch the catalog in batches."""
+        self.books_dir.mkdir(parents=True, exist_ok=True)
+        async for changes in awatch(self.books_dir, step=WATCH_STEP_MS, debounce=WATCH_DEBOUNCE_MS):
+            book_ids = {self._book_id_for(Path(path)) for _, path in changes}
+            book_ids.discard(None)
+            if not book_ids: continue
+
+            # Parsing thousands of files would stall every client, do it off the event loop
+            try:
+                parsed = await run.io_bound(self._read_many, book_ids)
+                self._apply(parsed)
+            except Exception:
+                # One bad metadata file must not stop the watcher for good
+                log.exception('catalog update for %s failed', ', '.join(sorted(book_ids)))
+
+    # --- CHANGE NOTIFICATION ---
+    def subscribe(self, listener: Callable[[List[str], List[str]], None]):
+        """Register `listener(updated_ids, removed_ids)`, called after every change."""
+        self._listeners.append(listener)
+        if self._loaded:
+            # Late subscribers get the current contents as one big update
+            self._notify(listener, list(self._books), [])
+
+    def _changed(self, updated: List[str], removed: List[str]):
+        self.version += 1
+        for listener in self._listeners:
+            self._notify(listener, updated, removed)
+
+    @staticmethod
+    def _notify(listener, updated: List[str], removed: List[str]):
+        # One failing index must not leave the others stale or stop the caller
+        try:
+            listener(updated, removed)
+        except Exception:
+            log.exception('catalog listener %r failed', listener)
+
+    # --- LOOKUPS ---
+    def get(self, book_id) -> Optional[Dict]:
+        """Return the metadata of one book, or None if it is not in the library."""
+        self._ensure_loaded()
+        return self._books.get(str(book_id))
+
+    def all(self) -> List[Dict]:
+        """Return every book's metadata. The dicts are shared, so don't mutate them."""
+        self._ensure_loaded()
+        return list(self._books.values())
+
+    def ids(self) -> List[str]:
+        self._ensure_loaded()
+        return list(self._books)
+
+    def __iter__(self) -> Iterator[Dict]:
+        return iter(self.all())
+
+    def __len__(self) -> int:
+        self._ensure_loaded()
+        return len(self._books)
+
+    def __contains__(self, book_id) -> bool:
+        self._ensure_loaded()
+        return str(book_id) in self._books
+
+
+catalog = Catalog(BOOKS_DIR, catalog_db.open_configured())
+
+# Load eagerly when the server starts so the first visitor doesn't pay for the scan,
+# then keep the cache in sync with uploads and manual drops into data/books
+def _start_catalog():
+    catalog._ensure_loaded()
+    if catalog.db is not None:
+        background_tasks.create(catalog.reconcile(), name='catalog reconcile')
+    background_tasks.create(catalog.watch(), name='catalog watcher')
+
+app.on_startup(_start_catalog)
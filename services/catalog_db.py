@@ -0,0 +1,161 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# --- CONFIGURATION ---
+BASE_DIR = Path(__file__).resolve().parent.parent
+BOOKS_DIR = BASE_DIR / 'data' / 'books'
+DEFAULT_DB_PATH = BASE_DIR / 'data' / 'index' / 'catalog.db'
+
+# LIBRE_CATALOG_DB=1 keeps the catalog in DEFAULT_DB_PATH, any other value is
+# taken as the database path. Unset (or 0) keeps the plain metadata.json scan.
+ENV_VAR = 'LIBRE_CATALOG_DB'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS books (
+    id             TEXT PRIMARY KEY,
+    title          TEXT NOT NULL,
+    author         TEXT NOT NULL,
+    language       TEXT NOT NULL,
+    category       TEXT NOT NULL,
+    download_count INTEGER NOT NULL DEFAULT 0,
+    mtime_ns       INTEGER NOT NULL,     -- of metadata.json when it was imported
+    metadata       TEXT NOT NULL         -- the parsed metadata.json, as JSON
+);
+CREATE TABLE IF NOT EXISTS book_subjects (
+    book_id TEXT NOT NULL REFERENCES books(id) ON DELETE CASCADE,
+    subject TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS book_subjects_book ON book_subjects(book_id);
+-- Searching and filtering are served by the in-memory indexes; nothing queries
+-- these columns, so databases created before that drop their indexes
+DROP INDEX IF EXISTS books_title;
+DROP INDEX IF EXISTS books_author;
+DROP INDEX IF EXISTS books_language;
+DROP INDEX IF EXISTS books_category;
+DROP INDEX IF EXISTS books_download_count;
+DROP INDEX IF EXISTS book_subjects_subject;
+'''
+
+def configured_path() -> Optional[Path]:
+    value = os.environ.get(ENV_VAR, '').strip()
+    if value in ('', '0'): return None
+    return DEFAULT_DB_PATH if value == '1' else Path(value)
+
+def _metadata_mtime(books_dir: Path, book_id: str) -> int:
+    try:
+        return (books_dir / book_id / 'metadata.json').stat().st_mtime_ns
+    except OSError:
+        return 0
+
+# --- THE DATABASE ---
+class CatalogDB:
+    """
+    SQLite copy of every book's metadata.json, in WAL mode.
+
+    Every thread gets its own connection, so the watcher's worker threads can
+    write while page handlers read. The full metadata is stored as JSON next to
+    a few plain columns, so a cold start needs one query instead of a file per book.
+    Only the book_id of book_subjects is indexed, for deletes.
+    """
+
+    def __init__(self, path: Path, books_dir: Path = BOOKS_DIR):
+        self.path = path
+        self.books_dir = books_dir
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    # --- WRITING ---
+    def store(self, parsed: Dict[str, Optional[Dict]]):
+        """Write freshly parsed metadata in one transaction; None deletes the book."""
+        # Imported late: services.catalog imports this module
+        from services.catalog import book_author, book_category
+        conn = self._conn()
+        with conn:
+            for book_id, data in parsed.items():
+                conn.execute('DELETE FROM books WHERE id = ?', (book_id,))
+                if data is None: continue
+                languages = data.get('languages') or ['en']
+                # The columns are NOT NULL, but metadata.json may say "name": null
+                author = book_author(data) or 'Unknown'
+                conn.execute(
+                    'INSERT INTO books (id, title, author, language, category, download_count, mtime_ns, metadata)'
+                    ' VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (book_id, str(data.get('title', 'Untitled')), str(author), str(languages[0]),
+                     book_category(data), int(data.get('download_count') or 0),
+                     _metadata_mtime(self.books_dir, book_id), json.dumps(data)))
+                conn.executemany('INSERT INTO book_subjects (book_id, subject) VALUES (?, ?)',
+                                 [(book_id, str(s)) for s in data.get('subjects') or []])
+
+    def stale_ids(self) -> Tuple[List[str], List[str]]:
+        """
+        Compare the database with the books folder by stat() alone.
+
+        Returns (changed, removed): books whose metadata.json is new or was
+        modified since it was imported, and books whose folder is gone.
+        """
+        known = dict(self._conn().execute('SELECT id, mtime_ns FROM books'))
+        changed = []
+        if self.books_dir.exists():
+            with os.scandir(self.books_dir) as entries:
+                for entry in entries:
+                    if not entry.is_dir(): continue
+                    mtime = _metadata_mtime(self.books_dir, entry.name)
+                    if mtime and known.pop(entry.name, None) != mtime:
+                        changed.append(entry.name)
+        return changed, list(known)
+
+    # --- READING ---
+    def load_all(self) -> Dict[str, Dict]:
+        rows = self._conn().execute('SELECT id, metadata FROM books ORDER BY rowid')
+        return {book_id: json.loads(metadata) for book_id, metadata in rows}
+
+    def __len__(self) -> int:
+        return self._conn().execute('SELECT COUNT(*) FROM books').fetchone()[0]
+
+    # --- IMPORT ---
+    def import_books(self, book_ids: Iterable[str] = None) -> Tuple[int, int]:
+        """
+        Bring the database up to date with data/books. Without `book_ids`
+        only new, modified and deleted books are touched.
+        Returns (imported, removed) counts.
+        """
+        from services.catalog import read_metadata
+        if book_ids is None:
+            changed, removed = self.stale_ids()
+        else:
+            changed, removed = [str(b) for b in book_ids], []
+
+        parsed = {book_id: read_metadata(self.books_dir / book_id) for book_id in changed}
+        parsed.update({book_id: None for book_id in removed})
+        self.store(parsed)
+        return sum(1 for data in parsed.values() if data is not None), len(removed)
+
+
+def open_configured() -> Optional[CatalogDB]:
+    """The catalog database selected by LIBRE_CATALOG_DB, or None when it is off."""
+    path = configured_path()
+    return CatalogDB(path) if path is not None else None
+
+# --- MIGRATION ---
+# python -m services.catalog_db             import new/changed books into the configured (or default) db
+# python -m services.catalog_db 84 1342     re-import just these books
+if __name__ == '__main__':
+    db = CatalogDB(configured_path() or DEFAULT_DB_PATH)
+    imported, removed = db.import_books(sys.argv[1:] or None)
+    print(f'{db.path}: {imported} imported, {removed} removed, {len(db)} books')
@@ -0,0 +1,297 @@
+import json
+import os
+import re
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from nicegui import run
+
+from services import storage
+
+# --- CONFIGURATION ---
+BASE_DIR = Path(__file__).resolve().parent.parent
+USERS_DIR = BASE_DIR / 'data' / 'users'
+
+# Per user, next to the chats/ folder: [{id, title, timestamp}, ...] newest first,
+# so the sidebar never has to open the chats themselves
+MANIFEST_NAME = 'chats.json'
+RECENT_LIMIT = 5
+
+# A chat is a JSON Lines file, chats/<id>.jsonl: a header record
+# {"id", "title", "created", "version"} followed by one line per message.
+# Sending a message appends a line, it never rewrites the conversation.
+CHAT_VERSION = 1
+CHAT_WINDOW = 50          # messages loaded when a chat is opened
+BLOCK_SIZE = 64 * 1024    # read size when scanning a chat backwards from its end
+
+def safe_name(username: str) -> str:
+    return "".join([c for c in username if c.isalpha() or c.isdigit()])
+
+def chat_folder(username: str) -> Path:
+    return USERS_DIR / safe_name(username) / 'chats'
+
+def manifest_path(username: str) -> Path:
+    return USERS_DIR / safe_name(username) / MANIFEST_NAME
+
+def valid_id(chat_id: Optional[str]) -> bool:
+    # Chat ids come from the URL and end up in a file name
+    return bool(chat_id) and re.fullmatch(r'[A-Za-z0-9-]+', chat_id) is not None
+
+def chat_path(username: str, chat_id: str) -> Path:
+    return chat_folder(username) / f'{chat_id}.jsonl'
+
+def _now() -> str:
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+def _line(record: Dict) -> str:
+    return json.dumps(record, ensure_ascii=False) + '\n'
+
+# --- READING ---
+def _read_header(path: Path) -> Optional[Dict]:
+    try:
+        with open(path, 'rb') as f:
+            return json.loads(f.readline())
+    except (OSError, ValueError):
+        return None
+
+def _read_tail(path: Path, limit: int, end: Optional[int] = None) -> Tuple[List[Dict], int, bool, bool]:
+    """
+    The last `limit` messages before byte offset `end` (default: the end of
+    the file), read backwards in blocks so only those lines are touched.
+    Returns (messages, offset of the first one, whether there are older ones,
+    whether a damaged line was seen). Passing that offset back as `end` gives
+    the messages before them.
+    """
+    with open(path, 'rb') as f:
+        first = len(f.readline())   # messages start after the header
+        if end is None:
+            end = f.seek(0, os.SEEK_END)
+        end = max(end, first)
+        pos, buf = end, b''
+        while pos > first and buf.count(b'\n') <= limit:
+            step = min(BLOCK_SIZE, pos - first)
+            pos -= step
+            f.seek(pos)
+            buf = f.read(step) + buf
+
+    # Line start offsets; the first piece is cut off unless we got back to the header
+    lines, offset = [], pos
+    for piece in buf.split(b'\n'):
+        lines.append((offset, piece))
+        offset += len(piece) + 1
+    if pos > first:
+        lines = lines[1:]
+    lines = [(o, piece) for o, piece in lines if piece.strip()][-limit:]
+
+    messages, damaged = [], False
+    for _, piece in lines:
+        try:
+            messages.append(json.loads(piece))
+        except ValueError:
+            damaged = True   # e.g. a line cut short by a crash; compaction drops it
+    start = lines[0][0] if lines else end
+    return messages, start, start > first, damaged
+
+# --- COMPACTION ---
+def _rewrite(path: Path, header: Dict, messages: List[Dict], mtime_ns: Optional[int] = None):
+    """Atomically replace a chat log. `mtime_ns` is kept as its modification time,
+    which is the chat's last activity: rewriting a chat is not chatting."""
+    temp = path.with_name(f'.{path.name}.tmp')
+    with open(temp, 'w', encoding='utf-8') as f:
+        f.write(_line(header))
+        for message in messages:
+            f.write(_line(message))
+        f.flush()
+        os.fsync(f.fileno())
+    if mtime_ns is not None:
+        os.utime(temp, ns=(mtime_ns, mtime_ns))
+    os.replace(temp, path)
+
+def _compact(path: Path) -> int:
+    """
+    Rewrite a chat log with only its header and intact messages.
+    Returns how many damaged lines were dropped.
+    """
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+        lines = [line for line in f if line.strip()]
+    try:
+        header = json.loads(lines[0])
+    except (IndexError, ValueError):
+        header = {'id': path.stem, 'title': 'Untitled Chat', 'created': _now()}
+    header['version'] = CHAT_VERSION
+    messages, dropped = [], 0
+    for line in lines[1:]:
+        try:
+            messages.append(json.loads(line))
+        except ValueError:
+            dropped += 1
+    _rewrite(path, header, messages, mtime_ns)
+    return dropped
+
+def _migrate(legacy: Path) -> Optional[Path]:
+    """Convert a chat saved as one JSON document (before the logs) into a log."""
+    try:
+        with open(legacy, 'r', encoding='utf-8') as f:
+            mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    header = {
+        'id': data.get('id') or legacy.stem,
+        'title': data.get('title', 'Untitled Chat'),
+        'created': data.get('timestamp', _now()),
+        'version': CHAT_VERSION,
+    }
+    path = legacy.with_suffix('.jsonl')
+    # Stays where it was in "recent" instead of jumping to the top
+    _rewrite(path, header, data.get('messages', []), mtime_ns)
+    legacy.unlink()
+    return path
+
+# --- CHATS ---
+def _open(path: Path, limit: int) -> Optional[Dict]:
+    if not path.exists():
+        legacy = path.with_suffix('.json')
+        if not legacy.exists() or _migrate(legacy) is None:
+            return None
+    header = _read_header(path)
+    if header is None:
+        return None
+    messages, start, older, damaged = _read_tail(path, limit)
+    return {'header': header, 'messages': messages, 'start': start, 'older': older, 'damaged': damaged}
+
+async def load_chat(username: str, chat_id: str, limit: int = CHAT_WINDOW) -> Optional[Dict]:
+    """
+    Open a chat: {'header', 'messages' (the last `limit`), 'start', 'older'},
+    or None if there is no such chat. 'older' tells whether there are earlier
+    messages, 'start' is the offset to pass to load_older() for them.
+    """
+    if not valid_id(chat_id):
+        return None
+    path = chat_path(username, chat_id)
+    async with storage.lock(path):
+        chat = await run.io_bound(_open, path, limit)
+        if chat and chat.pop('damaged'):
+            await run.io_bound(_compact, path)
+            chat = await run.io_bound(_open, path, limit)
+            chat.pop('damaged')
+    return chat
+
+async def load_older(username: str, chat_id: str, before: int, limit: int = CHAT_WINDOW) -> Tuple[List[Dict], int, bool]:
+    """The `limit` messages before offset `before`, the offset to continue from, and whether there are more."""
+    messages, start, older, _ = await run.io_bound(_read_tail, chat_path(username, chat_id), limit, before)
+    return messages, start, older
+
+async def create_chat(username: str, chat_id: str, title: str) -> Dict:
+    header = {'id': chat_id, 'title': title, 'created': _now(), 'version': CHAT_VERSION}
+    await storage.write_text(chat_path(username, chat_id), _line(header))
+    return header
+
+async def append_message(username: str, chat_id: str, message: Dict):
+    await storage.append_line(chat_path(username, chat_id), _line(message))
+
+# --- THE MANIFEST ---
+# Parsed manifests by path, with the mtime they were read at
+_cache: Dict[Path, Tuple[Optional[int], List[Dict]]] = {}
+
+def _entry(data: Dict) -> Dict:
+    return {
+        'id': data.get('id'),
+        'title': data.get('title', 'Untitled Chat'),
+        'timestamp': data.get('timestamp', ''),
+    }
+
+def _scan(folder: Path) -> List[Dict]:
+    """The manifest rebuilt from the chat files, for users who chatted before it existed."""
+    chats = []
+    if folder.exists():
+        for file_path in folder.glob('*.jsonl'):
+            header = _read_header(file_path)
+            if not isinstance(header, dict): continue
+            # The log's last append is the chat's last activity
+            updated = datetime.fromtimestamp(file_path.stat().st_mtime).strftime("%Y-%m-%d %H:%M:%S")
+            chats.append(_entry({**header, 'timestamp': updated}))
+        for file_path in folder.glob('*.json'):
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    chats.append(_entry(json.load(f)))
+            except (OSError, ValueError, AttributeError):
+                continue
+    chats.sort(key=lambda x: x['timestamp'], reverse=True)
+    return chats
+
+def _mtime(path: Path) -> Optional[int]:
+    try:
+        return path.stat().st_mtime_ns
+    except OSError:
+        return None
+
+def recent_chats(username: str, limit: int = RECENT_LIMIT) -> List[Dict]:
+    """The user's `limit` most recent chats, newest first."""
+    path = manifest_path(username)
+    mtime = _mtime(path)
+    cached = _cache.get(path)
+    if cached is None or cached[0] != mtime:
+        if mtime is None:
+            chats = _scan(chat_folder(username))
+        else:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    chats = json.load(f).get('chats', [])
+            except (OSError, ValueError, AttributeError):
+                chats = _scan(chat_folder(username))
+        cached = _cache[path] = (mtime, chats)
+    return cached[1][:limit]
+
+async def record_chat(username: str, chat: Dict):
+    """Add or move a chat to the top of the user's manifest after it was saved."""
+    path = manifest_path(username)
+    entry = _entry(chat)
+
+    # Another message in the chat that is already on top: only its time moves,
+    # so skip rewriting the manifest and just update the cached copy. The file
+    # keeps the chat on top, and is written again once another chat goes there.
+    cached = _cache.get(path)
+    if cached is None or cached[0] != _mtime(path):
+        recent_chats(username)
+        cached = _cache[path]
+    top = cached[1][0] if cached[1] else {}
+    if cached[0] is not None and top.get('id') == entry['id'] and top.get('title') == entry['title']:
+        cached[1][0] = entry
+        return
+
+    def apply(data):
+        if not isinstance(data.get('chats'), list):
+            data['chats'] = _scan(chat_folder(username))
+        chats = [c for c in data['chats'] if c.get('id') != entry['id']]
+        if chats and top.get('id') == chats[0].get('id'):
+            chats[0] = top   # with the time of its last message, only cached until now
+        # Saving stamps the chat with the current time, so this is almost always index 0
+        position = next((i for i, c in enumerate(chats) if c.get('timestamp', '') <= entry['timestamp']), len(chats))
+        chats.insert(position, entry)
+        data['chats'] = chats
+        return chats
+
+    try:
+        chats = await storage.update_json(path, apply, {}, indent=2)
+    except storage.CorruptFileError:
+        # Rebuilt from the chat files; the one just saved is among them
+        chats = _scan(chat_folder(username))
+        await storage.write_json(path, {'chats': chats}, indent=2)
+    _cache[path] = (_mtime(path), chats)
+
+# --- MAINTENANCE ---
+# python -m services.chats compact     convert old chats to logs and compact every log
+# Run it while the server is stopped, it takes no locks.
+if __name__ == '__main__':
+    if sys.argv[1:] == ['compact']:
+        for legacy in USERS_DIR.glob('*/chats/*.json'):
+            print('converted' if _migrate(legacy) else 'unreadable', legacy)
+        for log in USERS_DIR.glob('*/chats/*.jsonl'):
+            dropped = _compact(log)
+            if dropped: print(f'{log}: dropped {dropped} damaged lines')
+    else:
+        print('usage: python -m services.chats compact')
@@ -0,0 +1,156 @@
+import asyncio
+import hashlib
+import sys
+import time
+from html import escape
+from pathlib import Path
+from typing import Dict, Optional, Set
+
+import aiofiles
+import aiofiles.os
+import httpx
+from nicegui import app, background_tasks
+
+# --- CONFIGURATION ---
+BASE_DIR = Path(__file__).resolve().parent.parent
+BOOKS_DIR = BASE_DIR / 'data' / 'books'
+
+MIRROR_WORKERS = 4          # downloads in flight at once
+QUEUE_SIZE = 500            # covers waiting; beyond this, requests are dropped and retried on a later view
+TIMEOUT = 15.0              # seconds per download
+MAX_BYTES = 5 * 1024 * 1024
+RETRY_AFTER = 3600.0        # seconds before a failed cover is tried again
+
+EXTENSIONS = {'image/jpeg': '.jpg', 'image/png': '.png', 'image/webp': '.webp', 'image/gif': '.gif'}
+
+# Placeholder background colours, picked per book so a grid of them isn't uniform
+COLORS = ('#6366f1', '#8b5cf6', '#ec4899', '#0ea5e9', '#14b8a6', '#f59e0b', '#64748b')
+
+def remote_cover(book: Dict) -> Optional[str]:
+    """The book's remote cover URL, if it points somewhere we could mirror from."""
+    url = (book.get('formats') or {}).get('image/jpeg')
+    if isinstance(url, str) and url.startswith(('http://', 'https://')):
+        return url
+    return None
+
+# --- PLACEHOLDER ---
+def placeholder_svg(book: Optional[Dict], width: int = 400, height: int = 600) -> str:
+    """A cover-shaped SVG with the book's initials, drawn locally instead of fetched."""
+    title = str((book or {}).get('title') or 'Untitled')
+    initials = ''.join(word[0] for word in title.split()[:2]).upper() or '?'
+    color = COLORS[int(hashlib.md5(title.encode()).hexdigest(), 16) % len(COLORS)]
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}">'
+        f'<rect width="100%" height="100%" fill="{color}"/>'
+        f'<text x="50%" y="50%" dy=".35em" text-anchor="middle" font-family="Georgia, serif" '
+        f'font-size="{width // 4}" fill="#ffffff" fill-opacity="0.85">{escape(initials)}</text>'
+        f'</svg>'
+    )
+
+# --- DOWNLOADING ---
+async def fetch_cover(client: httpx.AsyncClient, book_id: str, url: str) -> Optional[Path]:
+    """Download one cover into the book's folder. Returns the file, or None on any failure."""
+    book_dir = BOOKS_DIR / str(book_id)
+    if not await aiofiles.os.path.isdir(book_dir): return None
+    temp = book_dir / '.cover.download'
+    try:
+        async with client.stream('GET', url, follow_redirects=True) as response:
+            content_type = response.headers.get('content-type', '').split(';')[0].strip()
+            if response.status_code != 200 or content_type not in EXTENSIONS:
+                return None
+            size = 0
+            async with aiofiles.open(temp, 'wb') as f:
+                async for block in response.aiter_bytes():
+                    size += len(block)
+                    if size > MAX_BYTES: return None
+                    await f.write(block)
+        # Renamed only once complete, so pages never pick up half a cover
+        target = book_dir / f'cover{EXTENSIONS[content_type]}'
+        await aiofiles.os.replace(temp, target)
+        return target
+    except (httpx.HTTPError, OSError):
+        return None
+    finally:
+        try:
+            await aiofiles.os.remove(temp)
+        except OSError:
+            pass
+
+# --- THE MIRROR ---
+class CoverMirror:
+    """
+    Copies remote covers into data/books/<id>/ in the background.
+
+    Views of a cover that isn't local yet call request(); a fixed pool of
+    workers drains the bounded queue, so a grid full of new books can't
+    open hundreds of connections at once.
+    """
+
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._pending: Set[str] = set()             # queued or downloading
+        self._failed: Dict[str, float] = {}         # book_id -> when it last failed
+
+    def request(self, book_id: str, book: Optional[Dict]):
+        """Queue a book's remote cover for mirroring. Cheap and non-blocking; repeats are ignored."""
+        url = remote_cover(book or {})
+        if self._queue is None or url is None: return
+        book_id = str(book_id)
+        if book_id in self._pending: return
+        if time.monotonic() - self._failed.get(book_id, -RETRY_AFTER) < RETRY_AFTER: return
+        try:
+            self._queue.put_nowait((book_id, url))
+            self._pending.add(book_id)
+        except asyncio.QueueFull:
+            pass
+
+    async def _worker(self):
+        while True:
+            book_id, url = await self._queue.get()
+            try:
+                if await fetch_cover(self._client, book_id, url) is None:
+                    self._failed[book_id] = time.monotonic()
+                else:
+                    self._failed.pop(book_id, None)
+            finally:
+                self._pending.discard(book_id)
+                self._queue.task_done()
+
+    def start(self):
+        self._queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self._client = httpx.AsyncClient(timeout=TIMEOUT,
+                                         limits=httpx.Limits(max_connections=MIRROR_WORKERS))
+        for i in range(MIRROR_WORKERS):
+            background_tasks.create(self._worker(), name=f'cover mirror {i}')
+
+    async def stop(self):
+        if self._client is not None:
+            await self._client.aclose()
+
+
+cover_mirror = CoverMirror()
+
+app.on_startup(cover_mirror.start)
+app.on_shutdown(cover_mirror.stop)
+
+# --- BULK MIRRORING ---
+# python -m services.covers          mirror every remote cover that isn't local yet
+# python -m services.covers 84       just this book
+async def _mirror_all(book_ids):
+    from services.catalog import catalog
+    from services.thumbnails import cover_path
+
+    semaphore = asyncio.Semaphore(MIRROR_WORKERS)
+    async with httpx.AsyncClient(timeout=TIMEOUT) as client:
+        async def mirror(book_id):
+            url = remote_cover(catalog.get(book_id) or {})
+            if url is None or cover_path(book_id) is not None: return
+            async with semaphore:
+                path = await fetch_cover(client, book_id, url)
+            print(book_id, path.name if path else f'failed: {url}')
+        await asyncio.gather(*(mirror(book_id) for book_id in book_ids))
+
+if __name__ == '__main__':
+    from services.catalog import catalog
+    asyncio.run(_mirror_all(sys.argv[1:] or catalog.ids()))
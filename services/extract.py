@@ -0,0 +1,146 @@
+import errno
+import json
+import os
+import posixpath
+import re
+import shutil
+import zipfile
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List
+from xml.etree import ElementTree
+
+try:
+    import pypdf
+except ImportError:  # optional: without it PDFs are stored but not made readable
+    pypdf = None
+
+# Nothing here imports NiceGUI, so these functions can run in the worker
+# processes of run.cpu_bound without starting a second app.
+
+# --- CONFIGURATION ---
+BASE_DIR = Path(__file__).resolve().parent.parent
+BOOKS_DIR = BASE_DIR / 'data' / 'books'
+
+BLOCK_TAGS = {'p', 'div', 'br', 'li', 'tr', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'blockquote', 'pre', 'section'}
+
+# --- FORMATS ---
+class _HTMLText(HTMLParser):
+    """Collects the text of an (X)HTML document, one paragraph per block element."""
+
+    def __init__(self):
+        super().__init__()
+        self.paragraphs: List[str] = []
+        self._current: List[str] = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ('script', 'style', 'head'): self._skip += 1
+        elif tag in BLOCK_TAGS: self._flush()
+
+    def handle_endtag(self, tag):
+        if tag in ('script', 'style', 'head'): self._skip = max(0, self._skip - 1)
+        elif tag in BLOCK_TAGS: self._flush()
+
+    def handle_data(self, data):
+        if not self._skip: self._current.append(data)
+
+    def _flush(self):
+        text = ' '.join(''.join(self._current).split())
+        if text: self.paragraphs.append(text)
+        self._current = []
+
+    def close(self):
+        super().close()
+        self._flush()
+
+def _epub_paragraphs(path: Path) -> Iterator[str]:
+    with zipfile.ZipFile(path) as z:
+        # The spine of the package document gives the reading order
+        container = ElementTree.fromstring(z.read('META-INF/container.xml'))
+        opf_path = next(e.get('full-path') for e in container.iter() if e.tag.endswith('rootfile'))
+        opf = ElementTree.fromstring(z.read(opf_path))
+        manifest = {e.get('id'): e.get('href') for e in opf.iter() if e.tag.endswith('}item')}
+        spine = [e.get('idref') for e in opf.iter() if e.tag.endswith('}itemref')]
+        base = posixpath.dirname(opf_path)
+        for idref in spine:
+            href = manifest.get(idref)
+            if not href: continue
+            parser = _HTMLText()
+            parser.feed(z.read(posixpath.normpath(posixpath.join(base, href))).decode('utf-8', 'replace'))
+            parser.close()
+            yield from parser.paragraphs
+
+def _xml_paragraphs(data: bytes, paragraph_tag: str, text_tag: str) -> Iterator[str]:
+    for element in ElementTree.fromstring(data).iter():
+        if element.tag.endswith('}' + paragraph_tag):
+            text = ''.join(t.text or '' for t in element.iter() if t.tag.endswith('}' + text_tag)).strip()
+            if text: yield text
+
+def _docx_paragraphs(path: Path) -> Iterator[str]:
+    with zipfile.ZipFile(path) as z:
+        yield from _xml_paragraphs(z.read('word/document.xml'), 'p', 't')
+
+def _pptx_paragraphs(path: Path) -> Iterator[str]:
+    with zipfile.ZipFile(path) as z:
+        slides = [n for n in z.namelist() if re.fullmatch(r'ppt/slides/slide\d+\.xml', n)]
+        for name in sorted(slides, key=lambda n: int(re.search(r'\d+', n).group())):
+            yield from _xml_paragraphs(z.read(name), 'p', 't')
+
+def _pdf_paragraphs(path: Path) -> Iterator[str]:
+    for page in pypdf.PdfReader(path).pages:
+        text = page.extract_text() or ''
+        # Pages come back hard-wrapped; blank lines are the only paragraph breaks worth keeping
+        for paragraph in re.split(r'\n\s*\n', text):
+            paragraph = ' '.join(paragraph.split())
+            if paragraph: yield paragraph
+
+EXTRACTORS: Dict[str, Callable[[Path], Iterator[str]]] = {
+    '.epub': _epub_paragraphs,
+    '.docx': _docx_paragraphs,
+    '.pptx': _pptx_paragraphs,
+}
+if pypdf is not None:
+    EXTRACTORS['.pdf'] = _pdf_paragraphs
+
+# --- THE STEP ---
+def extract_book(book_id: str) -> str:
+    """
+    Produce content.txt for an uploaded book from its document, so the
+    reader, the page index and the full-text index can use it.
+    Returns a short note on what was done, for the ingest log.
+    """
+    book_dir = BOOKS_DIR / str(book_id)
+    target = book_dir / 'content.txt'
+    with open(book_dir / 'metadata.json', 'r', encoding='utf-8') as f:
+        filename = (json.load(f).get('formats') or {}).get('application/octet-stream')
+    if not filename:
+        return 'no uploaded document'
+    source = book_dir / filename
+    if source == target:
+        return 'already text'
+    if target.exists() and target.stat().st_mtime_ns >= source.stat().st_mtime_ns:
+        return 'up to date'
+
+    ext = source.suffix.lower()
+    if ext not in ('.txt', '.md') and ext not in EXTRACTORS:
+        return f'no extractor for {ext or "this file type"}'
+    temp = target.with_suffix('.tmp')
+    temp.unlink(missing_ok=True)
+    try:
+        if ext in ('.txt', '.md'):
+            # Already text: another link to the upload's stored blob, not a second copy
+            try:
+                os.link(source, temp)
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK): raise
+                shutil.copyfile(source, temp)
+        else:
+            with open(temp, 'w', encoding='utf-8') as f:
+                for paragraph in EXTRACTORS[ext](source):
+                    f.write(paragraph + '\n\n')
+        temp.replace(target)
+    except BaseException:
+        temp.unlink(missing_ok=True)   # e.g. a damaged document
+        raise
+    return f'{target.stat().st_size} bytes of text'
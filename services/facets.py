@@ -0,0 +1,96 @@
+import heapq
+import threading
+from typing import Dict, List, Optional, Tuple
+from services.catalog import book_category, catalog
+
+# --- CONFIGURATION ---
+FACETS = ('category', 'subject', 'language', 'author')
+
+def book_facets(book: Dict) -> Dict[str, List[str]]:
+    """The values a book is filed under, per facet. A book can have several of each."""
+    authors = book.get('authors') or []
+    if not isinstance(authors, list): authors = [authors]
+    return {
+        'category': [book_category(book)],
+        'subject': [str(s) for s in book.get('subjects') or []],
+        'language': [str(l) for l in book.get('languages') or ['en']],
+        'author': [a.get('name') or 'Unknown' if isinstance(a, dict) else str(a) for a in authors],
+    }
+
+# --- THE INDEX ---
+class FacetIndex:
+    """
+    Book ids per facet value (every subject, language and author, plus the
+    /books category), kept in step with the catalog one book at a time.
+
+    Each value maps to an insertion-ordered dict of ids, so counts are a
+    len() and filters on several facets intersect precomputed sets,
+    starting from the smallest one. Ranked counts are cached until the
+    next change, since every /books visit asks for them.
+    """
+
+    def __init__(self):
+        self._values: Dict[str, Dict[str, Dict[str, None]]] = {f: {} for f in FACETS}  # facet -> value -> ids
+        self._book_values: Dict[str, Dict[str, List[str]]] = {}                         # book_id -> its values, for removal
+        self._counts: Dict[Tuple[str, Optional[int]], List[Tuple[str, int]]] = {}      # (facet, limit) -> counts()
+        self._lock = threading.RLock()
+
+    # --- MAINTENANCE ---
+    def add(self, book_id: str, book: Dict):
+        with self._lock:
+            self._remove(book_id)
+            values = book_facets(book)
+            for facet, facet_values in values.items():
+                for value in facet_values:
+                    self._values[facet].setdefault(value, {})[book_id] = None
+            self._book_values[book_id] = values
+
+    def remove(self, book_id: str):
+        with self._lock:
+            self._remove(book_id)
+
+    def _remove(self, book_id: str):
+        self._counts.clear()
+        for facet, facet_values in self._book_values.pop(book_id, {}).items():
+            for value in facet_values:
+                ids = self._values[facet].get(value)
+                if ids is None: continue
+                ids.pop(book_id, None)
+                if not ids:
+                    del self._values[facet][value]
+
+    def update(self, updated: List[str], removed: List[str]):
+        """Catalog listener: re-file changed books, drop deleted ones."""
+        with self._lock:
+            for book_id in removed:
+                self._remove(book_id)
+            for book_id in updated:
+                book = catalog.get(book_id)
+                if book is not None:
+                    self.add(book_id, book)
+
+    # --- QUERYING ---
+    def counts(self, facet: str, limit: Optional[int] = None) -> List[Tuple[str, int]]:
+        """(value, number of books) pairs of one facet, largest first."""
+        with self._lock:
+            pairs = self._counts.get((facet, limit))
+            if pairs is None:
+                # Both are stable, so equal counts keep the order the values first appeared in
+                items = ((v, len(ids)) for v, ids in self._values[facet].items())
+                count = lambda pair: pair[1]
+                pairs = (sorted(items, key=count, reverse=True) if limit is None
+                         else heapq.nlargest(limit, items, key=count))
+                self._counts[(facet, limit)] = pairs
+        return list(pairs)
+
+    def select(self, filters: Dict[str, str]) -> List[str]:
+        """Ids of the books that have every given facet value, e.g. {'language': 'en', 'author': ...}."""
+        with self._lock:
+            sets = sorted((self._values[facet].get(value, {}) for facet, value in filters.items()), key=len)
+            if not sets: return []
+            smallest, rest = sets[0], sets[1:]
+            return [book_id for book_id in smallest if all(book_id in ids for ids in rest)]
+
+
+facet_index = FacetIndex()
+catalog.subscribe(facet_index.update)
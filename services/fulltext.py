@@ -0,0 +1,331 @@
+import mmap
+import os
+import re
+import struct
+import sys
+import zlib
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from services.text import CHUNK_SIZE, clean_text, display_text, iter_clean
+
+# --- CONFIGURATION ---
+BASE_DIR = Path(__file__).resolve().parent.parent
+BOOKS_DIR = BASE_DIR / 'data' / 'books'
+INDEX_DIR = BASE_DIR / 'data' / 'index' / 'fulltext'
+
+WORD_RE = re.compile(r'\w+')
+
+# Segment header: magic, format version, term count, occurrence count,
+# the size / mtime of the content.txt it was built from, and the size of
+# the term filter that follows it
+HEADER = struct.Struct('<4sIIIQQI')
+MAGIC = b'LLFT'
+VERSION = 2
+
+# Every segment starts with a Bloom filter of its terms, which is all the
+# index keeps in memory: a query only opens the segments whose filter has
+# all its words. 10 bits and 7 probes per term give ~1% false positives.
+FILTER_BITS_PER_TERM = 10
+FILTER_PROBES = 7
+
+SNIPPET_BYTES = 160      # raw bytes read on each side of a hit for its snippet
+PAGES_PER_RESULT = 3     # snippets returned per matching book
+
+def tokenize(text: str) -> List[str]:
+    return WORD_RE.findall(text.lower())
+
+def _probes(term: bytes, size: int) -> List[int]:
+    """The filter bits of a term (double hashing)."""
+    h1, h2 = zlib.crc32(term), zlib.adler32(term) | 1
+    return [(h1 + i * h2) % (size * 8) for i in range(FILTER_PROBES)]
+
+def might_contain(term_filter: bytes, term: str) -> bool:
+    """False if the segment certainly lacks `term`; True means it probably has it."""
+    if not term_filter: return False
+    return all(term_filter[bit >> 3] & (1 << (bit & 7))
+               for bit in _probes(term.encode('utf-8', 'surrogateescape'), len(term_filter)))
+
+# --- BUILDING ---
+def build_segment(source: Path, target: Path):
+    """
+    Tokenize one book into a positional segment file.
+
+    For every occurrence of a term the segment stores its word position (for
+    phrase queries), its offset in the cleaned text (which gives the reader
+    page) and its byte offset in content.txt (for snippets). Terms are sorted
+    by their UTF-8 bytes so they can be binary searched straight from the map.
+    """
+    occurrences: Dict[str, Tuple[array, array, array]] = {}
+    position = 0
+    cleaned_offset = 0
+
+    for byte_offset, text, verbatim in iter_clean(source):
+        if verbatim:
+            consumed_chars, consumed_bytes = 0, 0
+            for match in WORD_RE.finditer(text):
+                consumed_bytes += len(text[consumed_chars:match.start()].encode('utf-8', 'surrogateescape'))
+                consumed_chars = match.start()
+
+                entry = occurrences.get(match.group().lower())
+                if entry is None:
+                    entry = occurrences[match.group().lower()] = (array('I'), array('I'), array('I'))
+                entry[0].append(position)
+                entry[1].append(cleaned_offset + match.start())
+                entry[2].append(byte_offset + consumed_bytes)
+                position += 1
+        cleaned_offset += len(text)
+
+    terms = sorted(t.encode('utf-8', 'surrogateescape') for t in occurrences)
+    term_offsets, occurrence_starts = array('I', [0]), array('I', [0])
+    positions, cleaned_offsets, byte_offsets = array('I'), array('I'), array('I')
+    for term in terms:
+        entry = occurrences[term.decode('utf-8', 'surrogateescape')]
+        positions.extend(entry[0])
+        cleaned_offsets.extend(entry[1])
+        byte_offsets.extend(entry[2])
+        term_offsets.append(term_offsets[-1] + len(term))
+        occurrence_starts.append(len(positions))
+
+    term_filter = bytearray((len(terms) * FILTER_BITS_PER_TERM + 7) // 8)
+    for term in terms:
+        for bit in _probes(term, len(term_filter)):
+            term_filter[bit >> 3] |= 1 << (bit & 7)
+
+    stat = source.stat()
+    target.parent.mkdir(parents=True, exist_ok=True)
+    temp = target.with_suffix('.tmp')
+    with open(temp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(terms), len(positions), stat.st_size, stat.st_mtime_ns,
+                            len(term_filter)))
+        f.write(term_filter)
+        for part in (term_offsets, occurrence_starts, positions, cleaned_offsets, byte_offsets):
+            part.tofile(f)
+        f.write(b''.join(terms))
+    os.replace(temp, target)
+
+# --- READING ---
+def read_filter(path: Path) -> bytes:
+    """Just the term filter of a segment file. Raises OSError or ValueError."""
+    with open(path, 'rb') as f:
+        try:
+            magic, version, _, _, _, _, filter_size = HEADER.unpack(f.read(HEADER.size))
+        except struct.error:
+            raise ValueError(f'{path} is truncated')
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not a version {VERSION} segment')
+        return f.read(filter_size)
+
+class Segment:
+    """
+    A memory-mapped segment file; lookups never read more than they need.
+    Holds a file handle and a map until closed, so use it as a context manager.
+    """
+
+    def __init__(self, path: Path):
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.term_count, count, self.source_size, self.source_mtime, filter_size = \
+            HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f'{path} is not a version {VERSION} segment')
+
+        view = memoryview(self._map)
+        cursor = HEADER.size + filter_size
+        arrays = []
+        for length in (self.term_count + 1, self.term_count + 1, count, count, count):
+            arrays.append(view[cursor:cursor + 4 * length].cast('I'))
+            cursor += 4 * length
+        self._term_offsets, self._starts, self.positions, self.cleaned_offsets, self.byte_offsets = arrays
+        self._terms = view[cursor:]
+
+    def _term(self, i: int) -> bytes:
+        return bytes(self._terms[self._term_offsets[i]:self._term_offsets[i + 1]])
+
+    def find(self, term: str) -> Optional[Tuple[int, int]]:
+        """Return the [start, end) occurrence range of `term`, or None."""
+        key = term.encode('utf-8', 'surrogateescape')
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._term(middle) < key: low = middle + 1
+            else: high = middle
+        if low < self.term_count and self._term(low) == key:
+            return self._starts[low], self._starts[low + 1]
+        return None
+
+    def close(self):
+        for name in ('_term_offsets', '_starts', 'positions', 'cleaned_offsets', 'byte_offsets', '_terms'):
+            view = getattr(self, name, None)
+            if view is not None: view.release()
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self) -> 'Segment':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# --- THE INDEX ---
+class FullTextIndex:
+    """
+    Persistent full-text index over every book's content.txt.
+
+    The index is one segment file per book under data/index/fulltext, so a
+    single upload only ever (re)writes its own segment. Only the segments'
+    term filters stay in memory; a search opens the segments that may hold
+    its words one at a time and closes each before the next.
+    """
+
+    def __init__(self, index_dir: Path, books_dir: Path):
+        self.index_dir = index_dir
+        self.books_dir = books_dir
+        self._filters: Dict[str, bytes] = {}   # book_id -> its segment's term filter
+        self._book_ids: Optional[set] = None  # books that have a segment on disk
+
+    def segment_path(self, book_id: str) -> Path:
+        return self.index_dir / f'{book_id}.seg'
+
+    def _filter(self, book_id: str) -> bytes:
+        if book_id not in self._filters:
+            try:
+                self._filters[book_id] = read_filter(self.segment_path(book_id))
+            except (OSError, ValueError):
+                return b''   # missing or from an older version: `build` rewrites it
+        return self._filters[book_id]
+
+    def indexed_ids(self) -> set:
+        if self._book_ids is None:
+            self._book_ids = {p.stem for p in self.index_dir.glob('*.seg')} if self.index_dir.exists() else set()
+        return self._book_ids
+
+    # --- MAINTENANCE ---
+    def is_fresh(self, book_id: str) -> bool:
+        source = self.books_dir / str(book_id) / 'content.txt'
+        try:
+            stat = source.stat()
+            with open(self.segment_path(book_id), 'rb') as f:
+                magic, version, _, _, size, mtime, _ = HEADER.unpack(f.read(HEADER.size))
+        except (OSError, struct.error):
+            return False
+        return magic == MAGIC and version == VERSION and (size, mtime) == (stat.st_size, stat.st_mtime_ns)
+
+    def update_book(self, book_id: str) -> bool:
+        """Bring one book's segment up to date. Returns True if it was (re)built."""
+        book_id = str(book_id)
+        source = self.books_dir / book_id / 'content.txt'
+        if not source.exists():
+            self.remove_book(book_id)
+            return False
+        if self.is_fresh(book_id):
+            return False
+
+        build_segment(source, self.segment_path(book_id))
+        self._filters.pop(book_id, None)
+        self.indexed_ids().add(book_id)
+        return True
+
+    def remove_book(self, book_id: str):
+        self._filters.pop(str(book_id), None)
+        self.segment_path(book_id).unlink(missing_ok=True)
+        self.indexed_ids().discard(str(book_id))
+
+    def build(self) -> int:
+        """Index every book whose segment is missing or stale. Returns how many were built."""
+        built = 0
+        if self.books_dir.exists():
+            for book_dir in self.books_dir.iterdir():
+                if book_dir.is_dir() and self.update_book(book_dir.name):
+                    built += 1
+        for book_id in list(self.indexed_ids()):
+            if not (self.books_dir / book_id).is_dir():
+                self.remove_book(book_id)
+        return built
+
+    # --- QUERYING ---
+    def _snippet(self, book_id: str, byte_offset: int) -> str:
+        start = max(0, byte_offset - SNIPPET_BYTES)
+        with open(self.books_dir / book_id / 'content.txt', 'rb') as f:
+            f.seek(start)
+            raw = f.read(byte_offset - start + 2 * SNIPPET_BYTES)
+        text = clean_text(raw.decode('utf-8', 'ignore').replace('\r\n', '\n').replace('\r', '\n'))
+        words = text.split(' ')
+        # Drop the words cut in half at either edge
+        if start > 0: words = words[1:]
+        return display_text('...' + ' '.join(' '.join(words[:-1]).split()) + '...')
+
+    def _book_hits(self, segment: Segment, words: List[str]) -> List[int]:
+        """Occurrence indices where the words appear as a phrase, in order."""
+        ranges = [segment.find(w) for w in words]
+        if any(r is None for r in ranges): return []
+
+        first_start, first_end = ranges[0]
+        if len(words) == 1: return list(range(first_start, first_end))
+
+        following = [set(segment.positions[start:end]) for start, end in ranges[1:]]
+        hits = []
+        for i in range(first_start, first_end):
+            position = segment.positions[i]
+            if all(position + k + 1 in positions for k, positions in enumerate(following)):
+                hits.append(i)
+        return hits
+
+    def search(self, query: str, limit: int = 20) -> List[Dict]:
+        """
+        Find books whose text contains `query` (as a phrase if it has several words).
+
+        Returns the best `limit` books as dicts with 'book_id', 'hits' and
+        'pages', a list of {'page', 'snippet'} where page is the zero-based
+        reader page (CHUNK_SIZE characters of cleaned text).
+        """
+        words = tokenize(query)
+        if not words: return []
+
+        # (book_id, hit count, [(page, byte offset), ...]) of every book with the phrase
+        matches = []
+        for book_id in list(self.indexed_ids()):
+            term_filter = self._filter(book_id)
+            if not all(might_contain(term_filter, w) for w in set(words)): continue
+            try:
+                segment = Segment(self.segment_path(book_id))
+            except (OSError, ValueError):
+                continue   # removed or rewritten meanwhile
+            with segment:
+                hits = self._book_hits(segment, words)
+                if not hits: continue
+                pages, seen = [], set()
+                for i in hits:
+                    page = segment.cleaned_offsets[i] // CHUNK_SIZE
+                    if page in seen: continue
+                    seen.add(page)
+                    pages.append((page, segment.byte_offsets[i]))
+                    if len(pages) >= PAGES_PER_RESULT: break
+            matches.append((book_id, len(hits), pages))
+        matches.sort(key=lambda m: m[1], reverse=True)
+
+        return [{'book_id': book_id, 'hits': hits,
+                 'pages': [{'page': page, 'snippet': self._snippet(book_id, offset)} for page, offset in pages]}
+                for book_id, hits, pages in matches[:limit]]
+
+
+fulltext_index = FullTextIndex(INDEX_DIR, BOOKS_DIR)
+
+# --- BUILD STEP ---
+# python -m services.fulltext                 index every new or changed book
+# python -m services.fulltext 84 1342         (re)index just these books
+# python -m services.fulltext --search "..."  try a query
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if args[:1] == ['--search']:
+        for result in fulltext_index.search(' '.join(args[1:])):
+            print(f"{result['book_id']}: {result['hits']} hits")
+            for page in result['pages']:
+                print(f"  page {page['page'] + 1}: {page['snippet']}")
+    elif args:
+        for book_id in args:
+            print(book_id, 'indexed' if fulltext_index.update_book(book_id) else 'up to date')
+    else:
+        print(f'{fulltext_index.build()} books indexed')
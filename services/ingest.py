@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from nicegui import app, background_tasks, run
+
+from services import artifacts, extract, storage, thumbnails, vectors
+from services.fulltext import fulltext_index
+
+# --- CONFIGURATION ---
+BASE_DIR = Path(__file__).resolve().parent.parent
+BOOKS_DIR = BASE_DIR / 'data' / 'books'
+JOBS_DIR = BASE_DIR / 'data' / 'index' / 'ingest'   # one <book_id>.json per unfinished job
+
+INGEST_WORKERS = 2
+
+log = logging.getLogger(__name__)
+
+# The pipeline, in order: (name, function of book_id, runs in a worker process?)
+# Process steps must be plain module-level functions free of NiceGUI state.
+STEPS: List[Tuple[str, Callable[[str], object], bool]] = [
+    ('extract', extract.extract_book, True),        # document -> content.txt
+    ('pages', artifacts.ensure, True),              # cleaned text + page offsets
+    ('fulltext', fulltext_index.update_book, False),
+    ('vectors', vectors.build_book, True),           # passage vectors for the chatbot
+    ('thumbnails', thumbnails.generate_all, False),
+]
+
+def _now() -> str:
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+def _summary(result) -> Optional[str]:
+    """What a step returned, shortened for the metadata."""
+    if isinstance(result, str): return result
+    if isinstance(result, dict) and 'pages' in result: return f"{len(result['pages'])} pages"
+    if isinstance(result, bool): return 'rebuilt' if result else 'up to date'
+    return None
+
+# --- THE QUEUE ---
+class IngestQueue:
+    """
+    Post-upload processing, off the page handlers.
+
+    submit() records a job file under data/index/ingest and queues the book;
+    a pool of INGEST_WORKERS tasks runs the STEPS for it, CPU-heavy ones in
+    the process pool. The status and timing of every step are written to the
+    book's metadata.json under 'ingest'. Steps already marked done are skipped,
+    so jobs left over from a crash or restart simply resume at startup.
+    """
+
+    def __init__(self, jobs_dir: Path, books_dir: Path):
+        self.jobs_dir = jobs_dir
+        self.books_dir = books_dir
+        self._queue: Optional[asyncio.Queue] = None
+        self._queued: Set[str] = set()
+
+    def _job_path(self, book_id: str) -> Path:
+        return self.jobs_dir / f'{book_id}.json'
+
+    async def submit(self, book_id: str):
+        """Queue a book for processing. Survives restarts once this returns."""
+        book_id = str(book_id)
+        await storage.write_json(self._job_path(book_id), {'book_id': book_id, 'submitted': _now()})
+        await self._update_status(book_id, lambda ingest: ingest.update(status='queued'))
+        self._enqueue(book_id)
+
+    def _enqueue(self, book_id: str):
+        if self._queue is not None and book_id not in self._queued:
+            self._queued.add(book_id)
+            self._queue.put_nowait(book_id)
+
+    # --- STATUS ---
+    async def _update_status(self, book_id: str, change: Callable[[Dict], None]):
+        def apply(metadata):
+            ingest = metadata.setdefault('ingest', {})
+            ingest.setdefault('steps', {})
+            change(ingest)
+            ingest['updated'] = _now()
+        await storage.update_json(self.books_dir / book_id / 'metadata.json', apply, {}, indent=2)
+
+    async def _read_steps(self, book_id: str) -> Dict[str, Dict]:
+        metadata = await storage.read_json(self.books_dir / book_id / 'metadata.json', {})
+        return (metadata.get('ingest') or {}).get('steps') or {}
+
+    # --- WORKING ---
+    async def process(self, book_id: str):
+        if not await storage.exists(self.books_dir / book_id / 'metadata.json'):
+            self._job_path(book_id).unlink(missing_ok=True)
+            return  # deleted while it was waiting
+
+        done = {name for name, step in (await self._read_steps(book_id)).items() if step.get('status') == 'done'}
+        await self._update_status(book_id, lambda ingest: ingest.update(status='running'))
+
+        for name, function, in_process in STEPS:
+            if name in done: continue
+            started = time.perf_counter()
+            try:
+                result = await (run.cpu_bound if in_process else run.io_bound)(function, book_id)
+                step = {'status': 'done', 'result': _summary(result)}
+            except Exception as e:
+                step = {'status': 'failed', 'error': (str(e).strip().splitlines() or [type(e).__name__])[-1][:300]}
+            if app.is_stopping:
+                return  # the pools are gone, the job file stays and resumes next start
+            step['seconds'] = round(time.perf_counter() - started, 3)
+
+            def record(ingest, name=name, step=step):
+                ingest['steps'][name] = step
+                if step['status'] == 'failed': ingest['status'] = 'failed'
+            await self._update_status(book_id, record)
+            if step['status'] == 'failed':
+                break
+        else:
+            await self._update_status(book_id, lambda ingest: ingest.update(status='done'))
+
+        self._job_path(book_id).unlink(missing_ok=True)
+
+    async def _worker(self):
+        while True:
+            book_id = await self._queue.get()
+            try:
+                await self.process(book_id)
+            except Exception:
+                # Leave the job file in place, it is retried on the next start
+                log.exception('ingest of %s failed', book_id)
+            finally:
+                self._queued.discard(book_id)
+                self._queue.task_done()
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        for i in range(INGEST_WORKERS):
+            background_tasks.create(self._worker(), name=f'ingest worker {i}')
+        # Resume whatever was submitted but not finished before the last shutdown
+        if self.jobs_dir.exists():
+            for job in sorted(self.jobs_dir.glob('*.json'), key=lambda p: p.stat().st_mtime):
+                self._enqueue(job.stem)
+
+
+ingest_queue = IngestQueue(JOBS_DIR, BOOKS_DIR)
+
+app.on_startup(ingest_queue.start)
+
+# --- MANUAL RUNS ---
+# python -m services.ingest 84 1342     run the whole pipeline for these books, in this process
+if __name__ == '__main__':
+    for book_id in sys.argv[1:]:
+        for name, function, _ in STEPS:
+            started = time.perf_counter()
+            result = function(book_id)
+            print(book_id, name, _summary(result), f'{time.perf_counter() - started:.2f}s')
@@ -0,0 +1,93 @@
+import asyncio
+import json
+import os
+from typing import AsyncIterator, Dict, List, Optional
+
+import httpx
+from nicegui import app
+
+# --- CONFIGURATION ---
+# The chatbot writes its answers with any OpenAI-compatible server (llama.cpp,
+# Ollama, vLLM, the OpenAI API, or services/llm_stub.py) once it is given one:
+#   LIBRE_LLM_URL=http://localhost:11434/v1 LIBRE_LLM_MODEL=llama3.2 python test-library.py
+# Without LIBRE_LLM_URL it keeps answering from the library on its own.
+URL_VAR = 'LIBRE_LLM_URL'
+MODEL_VAR = 'LIBRE_LLM_MODEL'
+KEY_VAR = 'LIBRE_LLM_KEY'
+
+MAX_CONCURRENT = 4      # completions streaming at once; more wait for a free slot
+CONNECT_TIMEOUT = 5.0
+READ_TIMEOUT = 60.0     # longest wait for the next chunk of a reply
+MAX_TOKENS = 512
+
+class LLMError(Exception):
+    """The server could not be reached or refused the request."""
+
+# --- BACKENDS ---
+# A backend is anything with `async def stream(messages)` yielding text as it
+# is generated, where messages are OpenAI-style {'role', 'content'} dicts.
+class OpenAIBackend:
+    """
+    Streams chat completions from an OpenAI-compatible /chat/completions endpoint.
+
+    One pooled httpx client is shared by every chat, and a semaphore keeps at
+    most MAX_CONCURRENT requests in flight so a busy page can't swamp a small
+    local model server.
+    """
+
+    def __init__(self, base_url: str, model: str, api_key: Optional[str] = None):
+        self.base_url = base_url.rstrip('/')
+        self.model = model
+        self.api_key = api_key
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def start(self):
+        headers = {'Authorization': f'Bearer {self.api_key}'} if self.api_key else {}
+        self._semaphore = asyncio.Semaphore(MAX_CONCURRENT)
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url, headers=headers,
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=MAX_CONCURRENT, max_keepalive_connections=MAX_CONCURRENT))
+
+    async def stop(self):
+        if self._client is not None:
+            await self._client.aclose()
+
+    async def stream(self, messages: List[Dict]) -> AsyncIterator[str]:
+        """Yield the reply piece by piece as the server sends it. Raises LLMError."""
+        if self._client is None:
+            raise LLMError('the model backend is not running')
+        payload = {'model': self.model, 'messages': messages, 'stream': True, 'max_tokens': MAX_TOKENS}
+        async with self._semaphore:
+            try:
+                async with self._client.stream('POST', '/chat/completions', json=payload) as response:
+                    if response.status_code != 200:
+                        await response.aread()
+                        raise LLMError(f'{response.status_code}: {response.text[:200]}')
+                    # Server-sent events: "data: {chunk}" lines, then "data: [DONE]"
+                    async for line in response.aiter_lines():
+                        if not line.startswith('data:'): continue
+                        data = line[5:].strip()
+                        if data == '[DONE]': break
+                        try:
+                            chunk = json.loads(data)
+                        except ValueError:
+                            continue
+                        for choice in chunk.get('choices') or []:
+                            text = (choice.get('delta') or {}).get('content')
+                            if text: yield text
+            except httpx.HTTPError as e:
+                raise LLMError(str(e) or type(e).__name__) from e
+
+def configured_backend() -> Optional[OpenAIBackend]:
+    url = os.environ.get(URL_VAR, '').strip()
+    if not url: return None
+    return OpenAIBackend(url, os.environ.get(MODEL_VAR, '').strip() or 'default', os.environ.get(KEY_VAR) or None)
+
+
+backend = configured_backend()
+
+if backend is not None:
+    app.on_startup(backend.start)
+    app.on_shutdown(backend.stop)
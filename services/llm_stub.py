@@ -0,0 +1,61 @@
+import asyncio
+import json
+import sys
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+# A stand-in for a real model server, speaking just enough of the OpenAI
+# chat completions API (streaming and not) to develop and test the chatbot
+# without a GPU or network access. It answers by echoing the question back
+# one word at a time.
+#
+# python -m services.llm_stub [port]     then start the app with
+# LIBRE_LLM_URL=http://localhost:8001/v1
+
+# --- CONFIGURATION ---
+PORT = 8001
+FIRST_TOKEN_DELAY = 0.2     # seconds, like a model reading its prompt
+TOKEN_DELAY = 0.03          # seconds between words
+
+stub = FastAPI()
+
+def _reply(messages) -> str:
+    question = next((m.get('content', '') for m in reversed(messages) if m.get('role') == 'user'), '')
+    context = sum(1 for m in messages if m.get('role') == 'system')
+    return f'This is the stub model ({context} system messages). You asked: {question}'
+
+def _chunk(model: str, delta: dict, finish_reason=None) -> str:
+    chunk = {
+        'id': 'chatcmpl-stub', 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': model,
+        'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}],
+    }
+    return f'data: {json.dumps(chunk)}\n\n'
+
+@stub.post('/v1/chat/completions')
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get('model', 'stub')
+    reply = _reply(body.get('messages') or [])
+
+    if not body.get('stream'):
+        return {
+            'id': 'chatcmpl-stub', 'object': 'chat.completion', 'created': int(time.time()), 'model': model,
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': reply}, 'finish_reason': 'stop'}],
+        }
+
+    async def events():
+        await asyncio.sleep(FIRST_TOKEN_DELAY)
+        yield _chunk(model, {'role': 'assistant'})
+        for i, word in enumerate(reply.split(' ')):
+            yield _chunk(model, {'content': word if i == 0 else ' ' + word})
+            await asyncio.sleep(TOKEN_DELAY)
+        yield _chunk(model, {}, 'stop')
+        yield 'data: [DONE]\n\n'
+
+    return StreamingResponse(events(), media_type='text/event-stream')
+
+if __name__ == '__main__':
+    uvicorn.run(stub, host='127.0.0.1', port=int(sys.argv[1]) if sys.argv[1:] else PORT)
@@ -0,0 +1,39 @@
+from typing import Dict, List, Tuple
+
+from services import artifacts
+
+# book_id -> ((size, mtime) of content.txt, byte offsets of every page in the cleaned text)
+_tables: Dict[str, Tuple[Tuple[int, int], List[int]]] = {}
+
+# --- PAGE TABLE ---
+def get_page_table(book_id: str) -> List[int]:
+    """
+    Byte offsets of every page in the book's cleaned-text artifact.
+
+    The artifacts are built on first use and rebuilt only when content.txt
+    changes; afterwards a lookup costs one stat() of content.txt.
+    """
+    book_id = str(book_id)
+    try:
+        stat = artifacts.content_path(book_id).stat()
+    except OSError:
+        _tables.pop(book_id, None)
+        return []
+
+    key = (stat.st_size, stat.st_mtime_ns)
+    cached = _tables.get(book_id)
+    if cached is None or cached[0] != key:
+        manifest = artifacts.ensure(book_id)
+        cached = _tables[book_id] = (key, manifest['pages'] if manifest else [])
+    return cached[1]
+
+def page_count(book_id: str) -> int:
+    return max(1, len(get_page_table(book_id)))
+
+# --- PAGES ---
+def read_page(book_id: str, page: int) -> str:
+    """Return one page of cleaned text, reading only that page from disk."""
+    table = get_page_table(book_id)
+    if not 0 <= page < len(table): return ''
+    end = table[page + 1] if page + 1 < len(table) else None
+    return artifacts.read_range(book_id, table[page], end)
@@ -0,0 +1,188 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from nicegui import app, background_tasks, run
+
+# --- CONFIGURATION ---
+BASE_DIR = Path(__file__).resolve().parent.parent
+USERS_DIR = BASE_DIR / 'data' / 'users'
+
+FLUSH_INTERVAL = 2.0        # seconds; the most progress a crash can lose
+COMPACT_AFTER = 500         # log records before the log is folded back into the snapshot
+
+SNAPSHOT_NAME = 'reading_history.json'   # {book_id: page}, least recently read first
+LOG_NAME = 'reading_history.log'         # one {"book": ..., "page": ...} per line
+
+log = logging.getLogger(__name__)
+
+def safe_name(username: str) -> str:
+    return "".join([c for c in username if c.isalpha() or c.isdigit()])
+
+# --- THE STORE ---
+class ProgressStore:
+    """
+    Reading progress of every user, kept in memory and persisted lazily.
+
+    Page turns only touch memory. A background task appends the new
+    positions to each user's reading_history.log every FLUSH_INTERVAL
+    seconds (and when a client disconnects), and once a log grows past
+    COMPACT_AFTER records it is folded into reading_history.json.
+    """
+
+    def __init__(self, users_dir: Path):
+        self.users_dir = users_dir
+        self._histories: Dict[str, Dict[str, int]] = {}   # user -> {book_id: page}, by recency
+        self._log_sizes: Dict[str, int] = {}               # user -> records in the log file
+        self._pending: Dict[str, List[Tuple[str, int]]] = {}
+        self._lock = threading.Lock()          # guards the dicts above
+        self._write_lock = threading.Lock()    # one flush or compaction at a time
+
+    def _paths(self, user: str) -> Tuple[Path, Path]:
+        user_dir = self.users_dir / user
+        return user_dir / SNAPSHOT_NAME, user_dir / LOG_NAME
+
+    # --- LOADING ---
+    def _history(self, username: str) -> Dict[str, int]:
+        """The in-memory history of a user, read from the snapshot plus log on first use."""
+        user = safe_name(username)
+        with self._lock:
+            if user in self._histories:
+                return self._histories[user]
+
+        snapshot_path, log_path = self._paths(user)
+        history: Dict[str, int] = {}
+        try:
+            with open(snapshot_path, 'r') as f:
+                history = {str(k): v for k, v in json.load(f).items()}
+        except (OSError, ValueError, AttributeError):
+            pass
+
+        records = 0
+        try:
+            with open(log_path, 'r') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # a line torn by a crash, everything before it is intact
+                    history.pop(record['book'], None)
+                    history[record['book']] = record['page']
+                    records += 1
+        except OSError:
+            pass
+
+        with self._lock:
+            # Another thread may have loaded the same user meanwhile, keep the first
+            self._log_sizes.setdefault(user, records)
+            return self._histories.setdefault(user, history)
+
+    # --- API ---
+    def get_page(self, username: str, book_id: str) -> int:
+        return self._history(username).get(str(book_id), 0)
+
+    def last_read(self, username: str) -> Optional[Tuple[str, int]]:
+        """The (book_id, page) the user read most recently, or None."""
+        history = self._history(username)
+        if not history: return None
+        book_id = next(reversed(history))
+        return book_id, history[book_id]
+
+    def record(self, username: str, book_id: str, page: int):
+        """Remember a page turn. Only touches memory; the next flush persists it."""
+        history = self._history(username)
+        user, book_id = safe_name(username), str(book_id)
+        with self._lock:
+            # Re-insert so the book moves to the end: most recently read
+            history.pop(book_id, None)
+            history[book_id] = page
+            self._pending.setdefault(user, []).append((book_id, page))
+
+    # --- PERSISTENCE ---
+    def _write(self, batch: Dict[str, List[Tuple[str, int]]]):
+        """Append the batch user by user, removing each user from it once written."""
+        with self._write_lock:
+            for user in list(batch):
+                self._append(user, batch[user])
+                del batch[user]
+
+    def _append(self, user: str, records: List[Tuple[str, int]]):
+        """Append one flush worth of records to a user's log, compacting if it got long."""
+        _, log_path = self._paths(user)
+        log_path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Only the last position per book matters within one flush
+        latest = {}
+        for book_id, page in records:
+            latest.pop(book_id, None)
+            latest[book_id] = page
+        lines = ''.join(json.dumps({'book': b, 'page': p}) + '\n' for b, p in latest.items())
+        with open(log_path, 'a') as f:
+            f.write(lines)
+
+        with self._lock:
+            self._log_sizes[user] = self._log_sizes.get(user, 0) + len(latest)
+            compact = self._log_sizes[user] >= COMPACT_AFTER
+        if compact:
+            self._compact(user)
+
+    def _compact(self, user: str):
+        """Rewrite the snapshot from memory and start a fresh log."""
+        snapshot_path, log_path = self._paths(user)
+        with self._lock:
+            history = dict(self._histories[user])
+        temp = snapshot_path.with_suffix('.tmp')
+        with open(temp, 'w') as f:
+            json.dump(history, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, snapshot_path)
+        # A crash right here only leaves log records the snapshot already contains
+        log_path.unlink(missing_ok=True)
+        with self._lock:
+            self._log_sizes[user] = 0
+
+    def _take_pending(self) -> Dict[str, List[Tuple[str, int]]]:
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        return batch
+
+    def _restore(self, batch: Dict[str, List[Tuple[str, int]]]):
+        """Put records a flush didn't write back in front of the ones recorded since."""
+        with self._lock:
+            for user, records in batch.items():
+                self._pending[user] = records + self._pending.get(user, [])
+
+    async def flush(self):
+        """Persist everything recorded since the last flush, off the event loop."""
+        batch = self._take_pending()
+        if not batch: return
+        try:
+            await run.io_bound(self._write, batch)
+        finally:
+            # Whatever is left failed to write (or io_bound skipped it during shutdown)
+            if batch:
+                self._restore(batch)
+
+    def flush_now(self):
+        """Blocking flush, for shutdown."""
+        self._write(self._take_pending())
+
+    async def run_flusher(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception:
+                # Keep flushing; the batch is back in pending for the next round
+                log.exception('flushing reading progress failed')
+
+
+progress_store = ProgressStore(USERS_DIR)
+
+app.on_startup(lambda: background_tasks.create(progress_store.run_flusher(), name='progress flusher'))
+app.on_disconnect(progress_store.flush)
+app.on_shutdown(progress_store.flush_now)
@@ -0,0 +1,202 @@
+import heapq
+import math
+import re
+import threading
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Tuple
+from services.catalog import catalog
+
+# --- CONFIGURATION ---
+TOKEN_RE = re.compile(r'\w+')
+
+# A hit in the title counts more than one in the author, which counts more than a subject
+FIELD_WEIGHTS = {'title': 3.0, 'author': 2.0, 'subject': 1.0}
+
+# Bonus for a query word that matches a whole term rather than just its beginning
+EXACT_BONUS = 1.5
+
+# Cap on how many vocabulary terms a single prefix may expand to
+MAX_PREFIX_TERMS = 200
+
+# Prefixes shorter than this are what every search starts with, and match a
+# good part of the library; they only expand to their SHORT_PREFIX_TERMS
+# shortest completions ("th": th, the, thy, tho, ...; "p": p, pa, pe, ...)
+SHORT_PREFIX_LENGTH = 3
+SHORT_PREFIX_TERMS = 10
+
+# Scores of this many recent query words are kept until the index changes:
+# while typing "love wa", "love" was already scored for "love w"
+WORD_CACHE_SIZE = 64
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+def book_fields(book: Dict) -> Dict[str, str]:
+    """The searchable text of a book, per field."""
+    authors = book.get('authors') or []
+    if not isinstance(authors, list): authors = [authors]
+    author_names = ' '.join(a.get('name') or '' if isinstance(a, dict) else str(a) for a in authors)
+    return {
+        'title': str(book.get('title', '')),
+        'author': author_names,
+        'subject': ' '.join(str(s) for s in book.get('subjects') or []),
+    }
+
+# --- THE INDEX ---
+class SearchIndex:
+    """
+    Token-based inverted index over titles, author names and subjects.
+
+    Every query word is treated as a prefix so results update while typing;
+    a book has to match all words, and results are ranked by field weight
+    times inverse document frequency. Searches may run on worker threads
+    while the catalog listener updates the index on the event loop.
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[str, float]] = {}  # term -> {book_id: weight}
+        self._book_terms: Dict[str, List[str]] = {}        # book_id -> its terms, for removal
+        self._titles: Dict[str, str] = {}                  # book_id -> title, for tie-breaks
+        self._vocabulary: List[str] = []                   # sorted terms, for prefix lookups
+        self._vocabulary_dirty = False
+        self._word_cache: Dict[str, Dict[str, float]] = {}  # query word -> _word_scores()
+        self._lock = threading.RLock()
+
+    # --- MAINTENANCE ---
+    def add(self, book_id: str, book: Dict):
+        with self._lock:
+            self._add(book_id, book)
+
+    def _add(self, book_id: str, book: Dict):
+        self._remove(book_id)
+        self._word_cache.clear()
+
+        weights: Dict[str, float] = {}
+        for field, text in book_fields(book).items():
+            for term in tokenize(text):
+                weights[term] = max(weights.get(term, 0.0), FIELD_WEIGHTS[field])
+
+        for term, weight in weights.items():
+            if term not in self._postings:
+                self._postings[term] = {}
+                self._vocabulary_dirty = True
+            self._postings[term][book_id] = weight
+        self._book_terms[book_id] = list(weights)
+        self._titles[book_id] = str(book.get('title', '')).lower()
+
+    def remove(self, book_id: str):
+        with self._lock:
+            self._remove(book_id)
+
+    def _remove(self, book_id: str):
+        self._word_cache.clear()
+        for term in self._book_terms.pop(book_id, []):
+            postings = self._postings.get(term)
+            if postings is None: continue
+            postings.pop(book_id, None)
+            if not postings:
+                del self._postings[term]
+                self._vocabulary_dirty = True
+        self._titles.pop(book_id, None)
+
+    def update(self, updated: List[str], removed: List[str]):
+        """Catalog listener: re-index changed books, drop deleted ones."""
+        with self._lock:
+            for book_id in removed:
+                self._remove(book_id)
+            for book_id in updated:
+                book = catalog.get(book_id)
+                if book is not None:
+                    self._add(book_id, book)
+
+    # --- QUERYING ---
+    def _expand(self, prefix: str) -> List[str]:
+        """All indexed terms starting with `prefix`, at most MAX_PREFIX_TERMS of them."""
+        if self._vocabulary_dirty:
+            # Rebuilt lazily so a bulk import sorts the vocabulary once, not per book
+            self._vocabulary = sorted(self._postings)
+            self._vocabulary_dirty = False
+
+        i = bisect_left(self._vocabulary, prefix)
+        if len(prefix) < SHORT_PREFIX_LENGTH:
+            # Pick from every completion, not the first few alphabetically:
+            # "the" sorts behind hundreds of "tha..." terms
+            end = bisect_left(self._vocabulary, prefix + '\U0010ffff', i)
+            return heapq.nsmallest(SHORT_PREFIX_TERMS, self._vocabulary[i:end], key=len)
+
+        terms = []
+        while i < len(self._vocabulary) and len(terms) < MAX_PREFIX_TERMS:
+            term = self._vocabulary[i]
+            if not term.startswith(prefix): break
+            terms.append(term)
+            i += 1
+        return terms
+
+    def _word_scores(self, word: str) -> Dict[str, float]:
+        """Best score per book for one query word across all the terms it expands to."""
+        if word in self._word_cache:
+            return self._word_cache[word]
+        total = len(self._book_terms) or 1
+        scores: Dict[str, float] = {}
+        # The longest posting list is copied in one go, the others merged into it
+        terms = sorted(self._expand(word), key=lambda t: len(self._postings[t]), reverse=True)
+        for term in terms:
+            postings = self._postings[term]
+            factor = math.log(1 + total / len(postings)) * (EXACT_BONUS if term == word else 1.0)
+            if not scores:
+                scores = {book_id: weight * factor for book_id, weight in postings.items()}
+                continue
+            for book_id, weight in postings.items():
+                score = weight * factor
+                if score > scores.get(book_id, 0.0):
+                    scores[book_id] = score
+        if len(self._word_cache) >= WORD_CACHE_SIZE:
+            del self._word_cache[next(iter(self._word_cache))]
+        self._word_cache[word] = scores
+        return scores
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[str]:
+        """Return the ids of the books matching every word of `query`, best first."""
+        return self.search_top(query, limit)[0]
+
+    def search_top(self, query: str, limit: Optional[int] = None,
+                   within: Optional[Iterable[str]] = None) -> Tuple[List[str], int]:
+        """
+        The best `limit` matches of `query` (all of them without a limit) and
+        how many books match in total. `within` restricts the search to those ids.
+        """
+        words = tokenize(query)
+        if not words: return [], 0
+        with self._lock:
+            scores = self._scores(words)
+            if within is not None:
+                within = within if isinstance(within, (set, frozenset, dict)) else set(within)
+                scores = {b: s for b, s in scores.items() if b in within}
+            return self._rank(scores, limit), len(scores)
+
+    def _scores(self, words: List[str]) -> Dict[str, float]:
+        # Start from the rarest word so the candidate set shrinks as fast as possible
+        per_word = sorted((self._word_scores(w) for w in set(words)), key=len)
+        scores = per_word[0]
+        for word_scores in per_word[1:]:
+            scores = {b: s + word_scores[b] for b, s in scores.items() if b in word_scores}
+            if not scores: break
+        return scores
+
+    def _rank(self, scores: Dict[str, float], limit: Optional[int]) -> List[str]:
+        """Best score first, ties by title; only the top `limit` are sorted."""
+        rank = lambda b: (-scores[b], self._titles.get(b, ''))
+        if limit is None or limit >= len(scores):
+            return sorted(scores, key=rank)
+        if limit <= 0: return []
+        # Thousands of matches share a handful of distinct scores, so find the
+        # lowest score that makes the cut on the bare floats, sort what beats
+        # it and fill up with the alphabetically first books tied at it
+        cutoff = heapq.nlargest(limit, scores.values())[-1]
+        above = sorted((b for b, s in scores.items() if s > cutoff), key=rank)
+        tied = [b for b, s in scores.items() if s == cutoff]
+        return above + heapq.nsmallest(limit - len(above), tied, key=self._titles.__getitem__)
+
+
+search_index = SearchIndex()
+catalog.subscribe(search_index.update)
@@ -0,0 +1,77 @@
+import hashlib
+import os
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Optional, Union
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+from nicegui import app
+from starlette.datastructures import Headers
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+# --- CONFIGURATION ---
+# URLs carrying the file's current fingerprint (?v=...) can never go stale,
+# so browsers may keep them for a year without asking again
+IMMUTABLE = 'public, max-age=31536000, immutable'
+# Anything else is revalidated every time, which costs a 304 when nothing changed
+REVALIDATE = 'no-cache'
+
+def fingerprint(stat_result: os.stat_result) -> str:
+    """A short version tag that changes whenever the file is replaced or modified."""
+    key = f'{stat_result.st_size}-{stat_result.st_mtime_ns}-{stat_result.st_ino}'
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+def versioned(url: str, path: Union[str, Path]) -> str:
+    """`url` with the fingerprint of the file behind it appended, or unchanged if it is missing."""
+    try:
+        return f'{url}?v={fingerprint(os.stat(path))}'
+    except OSError:
+        return url
+
+# --- RESPONSES ---
+def _not_modified(response: Response, requested: Headers) -> bool:
+    if_none_match = requested.get('if-none-match')
+    if if_none_match:
+        return response.headers['etag'] in [tag.strip(' W/') for tag in if_none_match.split(',')]
+    try:
+        return parsedate_to_datetime(requested['if-modified-since']) >= \
+            parsedate_to_datetime(response.headers['last-modified'])
+    except (KeyError, TypeError, ValueError):
+        return False
+
+def file_response(path: Union[str, Path], scope: Scope, stat_result: Optional[os.stat_result] = None,
+                  version: Optional[str] = None) -> Response:
+    """
+    Serve a file with a strong ETag and a cache policy based on ?v=.
+
+    `version` is the fingerprint the URL has to carry to be cached forever;
+    it defaults to the file's own. Range requests (PDF viewers seeking
+    through large uploads) are answered with 206 partial content by FileResponse.
+    """
+    stat_result = stat_result or os.stat(path)
+    etag = fingerprint(stat_result)
+    requested = Headers(scope=scope)
+    query = Request(scope).query_params
+    cache_control = IMMUTABLE if query.get('v') == (version or etag) else REVALIDATE
+
+    response = FileResponse(path, stat_result=stat_result,
+                            headers={'ETag': f'"{etag}"', 'Cache-Control': cache_control})
+    if _not_modified(response, requested):
+        return NotModifiedResponse(response.headers)
+    return response
+
+class FingerprintedStaticFiles(StaticFiles):
+    """StaticFiles that answers with file_response() instead of Starlette's defaults."""
+
+    def file_response(self, full_path, stat_result, scope, status_code=200) -> Response:
+        return file_response(full_path, scope, stat_result)
+
+def add_static_files(url_path: str, local_directory: Union[str, Path]):
+    """Drop-in for app.add_static_files() with fingerprint-aware caching."""
+    handler = FingerprintedStaticFiles(directory=local_directory)
+
+    @app.api_route(url_path.rstrip('/') + '/{path:path}', methods=['GET', 'HEAD'])
+    async def static_file(request: Request, path: str = '') -> Response:
+        return await handler.get_response(path, request.scope)
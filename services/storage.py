@@ -0,0 +1,111 @@
+import asyncio
+import json
+import os
+import uuid
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Callable, Dict
+
+import aiofiles
+import aiofiles.os
+
+# All helpers run the actual file I/O on aiofiles' worker threads (the event
+# loop's default, bounded executor), so a slow disk only delays the request
+# that touches it instead of freezing every connected client.
+#
+# Writes go to a temp file in the same folder which then replaces the target,
+# so a crash leaves either the old or the new file, never half of one. Logs
+# are the exception: append_line() adds one line at the end instead. Writes
+# and read-modify-write updates of one file are serialized by a per-file lock;
+# different files (i.e. different users) never wait for each other.
+
+class CorruptFileError(ValueError):
+    """A file exists but does not hold valid JSON, so it must not be overwritten blindly."""
+
+_locks: Dict[Path, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+def lock(path: Path) -> asyncio.Lock:
+    """The lock that serializes writes to `path`."""
+    return _locks[Path(path).absolute()]
+
+# --- READING ---
+async def exists(path: Path) -> bool:
+    return await aiofiles.os.path.exists(path)
+
+async def read_text(path: Path) -> str:
+    async with aiofiles.open(path, 'r', encoding='utf-8') as f:
+        return await f.read()
+
+async def load_json(path: Path, default: Any = None) -> Any:
+    """Load a JSON file. A missing file gives `default`, a corrupt one raises CorruptFileError."""
+    try:
+        text = await read_text(path)
+    except FileNotFoundError:
+        return default
+    try:
+        return json.loads(text)
+    except ValueError as e:
+        raise CorruptFileError(f'{path} is not valid JSON: {e}') from e
+
+async def read_json(path: Path, default: Any = None) -> Any:
+    """Load a JSON file for display. A missing, unreadable or corrupt file gives `default`."""
+    try:
+        return await load_json(path, default)
+    except (OSError, ValueError):
+        return default
+
+# --- WRITING ---
+async def _replace_text(path: Path, text: str):
+    """Write `text` to a temp file next to `path`, sync it, then swap it in. Caller holds the lock."""
+    await aiofiles.os.makedirs(path.parent, exist_ok=True)
+    temp = path.with_name(f'.{path.name}.{uuid.uuid4().hex}.tmp')
+    try:
+        async with aiofiles.open(temp, 'w', encoding='utf-8') as f:
+            await f.write(text)
+            await f.flush()
+            await aiofiles.os.wrap(os.fsync)(f.fileno())
+        await aiofiles.os.replace(temp, path)
+    except BaseException:
+        try:
+            await aiofiles.os.remove(temp)
+        except OSError:
+            pass
+        raise
+
+async def write_text(path: Path, text: str):
+    async with lock(path):
+        await _replace_text(path, text)
+
+async def write_json(path: Path, data: Any, indent: int = None):
+    await write_text(path, json.dumps(data, indent=indent))
+
+async def update_json(path: Path, update: Callable[[Any], Any], default: Any = None, indent: int = None) -> Any:
+    """
+    Read-modify-write a JSON file under its lock.
+
+    `update` gets the current content (or `default` if the file is missing),
+    changes it in place and may return a value, which update_json returns.
+    Raises CorruptFileError instead of replacing a file it cannot parse.
+    """
+    async with lock(path):
+        data = await load_json(path, default)
+        result = update(data)
+        await _replace_text(path, json.dumps(data, indent=indent))
+        return result
+
+async def append_line(path: Path, line: str):
+    """
+    Append one line to a log file under its lock, in O(1) whatever the file's size.
+    If a crash cut the previous line short, the new one still starts on a line of its own.
+    """
+    async with lock(path):
+        await aiofiles.os.makedirs(path.parent, exist_ok=True)
+        async with aiofiles.open(path, 'a+b') as f:
+            data = line.rstrip('\n').encode('utf-8') + b'\n'
+            size = await f.seek(0, os.SEEK_END)
+            if size:
+                await f.seek(size - 1)
+                if await f.read(1) != b'\n':
+                    data = b'\n' + data
+            await f.write(data)
+            await f.flush()
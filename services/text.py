@@ -0,0 +1,83 @@
+import codecs
+import re
+from pathlib import Path
+from typing import Iterator, Tuple
+
+# --- CONFIGURATION ---
+# Characters of cleaned text per reader page
+CHUNK_SIZE = 3000
+
+READ_SIZE = 64 * 1024
+
+# Every character of a file belongs to exactly one of these runs
+RUN_RE = re.compile(r'(?:\r\n|\r|\n)+| +|[^\r\n ]+')
+
+# --- HELPER: TEXT CLEANING ---
+def clean_text(text):
+    """Join hard-wrapped lines into paragraphs and collapse repeated spaces."""
+    if not text: return ""
+    text = re.sub(r'(?<!\n)\n(?!\n)', ' ', text)
+    text = re.sub(r' +', ' ', text)
+    return text
+
+def display_text(text: str) -> str:
+    """Replace the stand-ins for undecodable bytes that iter_clean() passes through."""
+    try:
+        text.encode('utf-8')
+        return text
+    except UnicodeEncodeError:
+        return text.encode('utf-8', 'surrogateescape').decode('utf-8', 'replace')
+
+def iter_clean(path: Path, offset: int = 0, after_space: bool = False) -> Iterator[Tuple[int, str, bool]]:
+    """
+    Stream clean_text() of a file without loading it into memory.
+
+    Yields (byte_offset, text, verbatim) for each run of the file, where
+    byte_offset is where the run starts in the raw file and verbatim tells
+    whether `text` is the raw run itself (so character i of it sits at
+    byte_offset + len(text[:i].encode())) or a replacement for line breaks
+    and spaces. Joining all the texts gives exactly what
+    clean_text(open(path).read()) would.
+
+    To resume in the middle of a file, pass the byte offset of a run (or of
+    a character inside a verbatim run) and whether the cleaned text right
+    before it ended with a space.
+    """
+    # surrogateescape keeps a 1:1 mapping between bad bytes and characters, so offsets stay exact
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='surrogateescape')
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        pending = ''
+        while True:
+            block = f.read(READ_SIZE)
+            final = not block
+            pending += decoder.decode(block, final=final)
+
+            runs = list(RUN_RE.finditer(pending))
+            if not final and runs:
+                # The last run may continue in the next block (e.g. a '\r' + '\n' split)
+                runs.pop()
+
+            for match in runs:
+                run = match.group()
+                first = run[0]
+                if first in '\r\n':
+                    # Universal newlines, as open(..., 'r') would have translated them
+                    breaks = run.count('\n') + run.count('\r') - run.count('\r\n')
+                    if breaks > 1:
+                        yield offset, '\n' * breaks, False
+                        after_space = False
+                    elif not after_space:
+                        yield offset, ' ', False
+                        after_space = True
+                elif first == ' ':
+                    if not after_space:
+                        yield offset, ' ', False
+                        after_space = True
+                else:
+                    yield offset, run, True
+                    after_space = False
+                offset += len(run.encode('utf-8', 'surrogateescape'))
+
+            if final: return
+            pending = pending[runs[-1].end():] if runs else pending
@@ -0,0 +1,136 @@
+import sys
+import threading
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from fastapi.responses import Response
+from nicegui import app, run
+
+from services.catalog import catalog
+from services.covers import cover_mirror, placeholder_svg, remote_cover
+from services.static import file_response, fingerprint
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional: without it the original covers are served
+    Image = ImageOps = None
+
+# --- CONFIGURATION ---
+BASE_DIR = Path(__file__).resolve().parent.parent
+BOOKS_DIR = BASE_DIR / 'data' / 'books'
+
+# Bounding box per size, about twice the CSS size they are shown at (for high-DPI screens)
+SIZES: Dict[str, Tuple[int, int]] = {
+    'sm': (256, 384),    # home page strip, bookmarks
+    'md': (400, 600),    # /books grid
+    'lg': (800, 1200),   # book details
+}
+QUALITY = 80
+
+COVER_NAMES = ('cover.jpg', 'cover.jpeg', 'cover.png', 'cover.webp', 'cover.gif')
+THUMBS_DIR = 'thumbs'    # per book: thumbs/cover.<size>.webp
+
+_locks: Dict[Tuple[str, str], threading.Lock] = defaultdict(threading.Lock)
+
+def cover_path(book_id: str) -> Optional[Path]:
+    """The book's own cover image, if it has one."""
+    for name in COVER_NAMES:
+        path = BOOKS_DIR / str(book_id) / name
+        if path.exists():
+            return path
+    return None
+
+def thumb_path(book_id: str, size: str) -> Path:
+    return BOOKS_DIR / str(book_id) / THUMBS_DIR / f'cover.{size}.webp'
+
+# --- GENERATION ---
+def ensure_thumb(book_id: str, size: str) -> Optional[Path]:
+    """
+    Return the thumbnail of a book's cover, (re)generating it if it is
+    missing or older than the cover. Returns the cover itself when Pillow is
+    not installed or the image can't be decoded, None if there is no cover.
+    """
+    source = cover_path(book_id)
+    if source is None: return None
+    if Image is None: return source
+
+    target = thumb_path(book_id, size)
+    with _locks[(str(book_id), size)]:
+        try:
+            if target.stat().st_mtime_ns >= source.stat().st_mtime_ns:
+                return target
+        except OSError:
+            pass
+
+        try:
+            with Image.open(source) as image:
+                image = ImageOps.exif_transpose(image)
+                image.thumbnail(SIZES[size], Image.LANCZOS)   # only ever shrinks
+                if image.mode not in ('RGB', 'RGBA'):
+                    image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+                target.parent.mkdir(exist_ok=True)
+                temp = target.with_suffix('.tmp')
+                image.save(temp, 'WEBP', quality=QUALITY, method=6)
+                temp.replace(target)
+        except (OSError, ValueError):
+            return source
+    return target
+
+def generate_all(book_id: str):
+    """Build every size of one book's thumbnails, e.g. right after an upload."""
+    for size in SIZES:
+        ensure_thumb(book_id, size)
+
+# --- URLS ---
+def thumb_url(book_id: str, size: str = 'md', version: Optional[str] = None) -> str:
+    """`version` is the cover's fingerprint; with it the thumbnail is cached for good."""
+    url = f'/thumbs/{book_id}/{size}'
+    return f'{url}?v={version}' if version else url
+
+def cover_version(source: Path) -> Optional[str]:
+    try:
+        return fingerprint(source.stat())
+    except OSError:
+        return None
+
+def cover_url(book: Dict, size: str = 'md') -> Optional[str]:
+    """
+    The URL to show a book's cover at. Books with a remote cover get the
+    thumbnail URL too: it serves a placeholder until the mirror has a copy.
+    None means the book has no cover at all.
+    """
+    book_id = str(book.get('id'))
+    source = cover_path(book_id)
+    if source is not None:
+        return thumb_url(book_id, size, cover_version(source))
+    if remote_cover(book) is not None:
+        return thumb_url(book_id, size)
+    return None
+
+@app.api_route('/thumbs/{book_id}/{size}', methods=['GET', 'HEAD'])
+async def serve_thumb(request: Request, book_id: str, size: str):
+    if size not in SIZES or book_id.startswith('.'):
+        raise HTTPException(status_code=404)
+    path = await run.io_bound(ensure_thumb, book_id, size)
+    if path is not None:
+        # Thumbnails are derived from the cover, so the cover's fingerprint versions them
+        return file_response(path, request.scope, version=cover_version(cover_path(book_id) or path))
+
+    book = catalog.get(book_id)
+    if book is None:
+        raise HTTPException(status_code=404)
+    # Not local (yet): fetch it in the background and show a placeholder meanwhile
+    cover_mirror.request(book_id, book)
+    return Response(placeholder_svg(book, *SIZES[size]), media_type='image/svg+xml',
+                    headers={'Cache-Control': 'no-store'})
+
+# --- BUILD STEP ---
+# python -m services.thumbnails          thumbnails for every book with a cover
+# python -m services.thumbnails 84      just this book
+if __name__ == '__main__':
+    book_ids = sys.argv[1:] or [p.name for p in BOOKS_DIR.iterdir() if p.is_dir()]
+    for book_id in book_ids:
+        generate_all(book_id)
+        print(book_id, 'done' if cover_path(book_id) else 'no cover')
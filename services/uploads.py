@@ -0,0 +1,154 @@
+import hashlib
+import os
+import re
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import Optional, Tuple
+
+import aiofiles.os
+from nicegui import Client, app, run
+from nicegui.elements.upload_files import FileUpload
+from starlette.responses import PlainTextResponse
+
+# --- CONFIGURATION ---
+BASE_DIR = Path(__file__).resolve().parent.parent
+BOOKS_DIR = BASE_DIR / 'data' / 'books'
+
+# Uploads are received here, on the same filesystem as the books and the
+# blob store, so saving one is a rename rather than a copy
+INCOMING_DIR = BOOKS_DIR / '.incoming'
+
+CHUNK_SIZE = 1024 * 1024
+STALE_AFTER = 24 * 3600     # seconds before an abandoned upload is swept away
+
+# POSTs to a ui.upload's URL; the body of one is refused when it is larger than
+# the element's max_total_size (or max_file_size times max_files) plus this
+# much room for the multipart boundaries and part headers
+UPLOAD_ROUTE_RE = re.compile(r'/_nicegui/client/([^/]+)/upload/(\d+)$')
+FORM_OVERHEAD = 64 * 1024
+
+class UploadTooLarge(ValueError):
+    pass
+
+# --- RECEIVING ---
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _take_over(spooled: Path, temp: Path):
+    shutil.move(spooled, temp)
+    os.chmod(temp, 0o644)  # spooled files are private to the process; books are not
+
+async def receive(file: FileUpload, max_bytes: int) -> Tuple[Path, str]:
+    """
+    Take an upload over into INCOMING_DIR and return the temp file with the
+    SHA-256 of its content. Raises UploadTooLarge if it is larger than `max_bytes`.
+    """
+    if file.size() > max_bytes:
+        raise UploadTooLarge(f'{file.name} is larger than {max_bytes / (1024 * 1024):.0f} MB')
+
+    await aiofiles.os.makedirs(INCOMING_DIR, exist_ok=True)
+    temp = INCOMING_DIR / f'{uuid.uuid4().hex}.part'
+    # NiceGUI has already spooled anything over 1 MB to a temp file; move it
+    # (a rename unless the system temp dir is on another filesystem)
+    spooled = getattr(file, '_path', None)
+    try:
+        if spooled is not None:
+            await run.io_bound(_take_over, spooled, temp)
+        else:
+            await file.save(temp)
+        digest = await run.io_bound(_sha256, temp)
+    except BaseException:
+        await discard(temp)
+        raise
+    return temp, digest
+
+async def discard(temp: Optional[Path]):
+    """Delete a received upload that won't be saved. None is ignored."""
+    if temp is None: return
+    try:
+        await aiofiles.os.remove(temp)
+    except OSError:
+        pass
+
+# --- REQUEST SIZE LIMIT ---
+def _upload_limit(path: str) -> Optional[int]:
+    """The most bytes the ui.upload behind `path` accepts, None if it isn't one or has no limit."""
+    match = UPLOAD_ROUTE_RE.search(path)
+    client = Client.instances.get(match.group(1)) if match else None
+    element = client.elements.get(int(match.group(2))) if client else None
+    if element is None: return None
+    props = element.props
+    if props.get('max-total-size'):
+        return props['max-total-size'] + FORM_OVERHEAD
+    if props.get('max-file-size'):
+        return props['max-file-size'] * (props.get('max-files') or 1) + FORM_OVERHEAD
+    return None
+
+class _BodyTooLarge(Exception):
+    pass
+
+class UploadSizeLimit:
+    """
+    ASGI middleware answering 413 to upload requests larger than their
+    ui.upload allows. Starlette spools the whole form to disk before any
+    upload handler runs, so the limit has to hold for the request body:
+    by its Content-Length up front, or by counting when it is chunked.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        limit = _upload_limit(scope['path']) if scope['type'] == 'http' and scope['method'] == 'POST' else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        too_large = PlainTextResponse(f'Upload larger than {limit} bytes', status_code=413)
+        length = dict(scope['headers']).get(b'content-length', b'')
+        if length.isdigit() and int(length) > limit:
+            await too_large(scope, receive, send)
+            return
+
+        received, started = 0, False
+        async def counting_receive():
+            nonlocal received
+            message = await receive()
+            received += len(message.get('body', b''))
+            if received > limit:
+                raise _BodyTooLarge()
+            return message
+        async def tracking_send(message):
+            nonlocal started
+            started = True
+            await send(message)
+        try:
+            await self.app(scope, counting_receive, tracking_send)
+        except _BodyTooLarge:
+            if not started:
+                await too_large(scope, receive, send)
+
+app.add_middleware(UploadSizeLimit)
+
+# --- CLEANUP ---
+def sweep_stale():
+    """Delete uploads that were received but never saved, e.g. when the server stopped."""
+    if not INCOMING_DIR.exists(): return
+    cutoff = time.time() - STALE_AFTER
+    for path in INCOMING_DIR.iterdir():
+        try:
+            if path.stat().st_mtime < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+async def _sweep_on_startup():
+    await run.io_bound(sweep_stale)
+
+app.on_startup(_sweep_on_startup)
@@ -0,0 +1,296 @@
+import math
+import os
+import re
+import sys
+import threading
+import time
+import zlib
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from services import artifacts
+from services.fulltext import tokenize
+from services.text import display_text
+
+# Nothing here imports NiceGUI, so build_book() can run in the worker
+# processes of run.cpu_bound.
+
+# --- CONFIGURATION ---
+BASE_DIR = Path(__file__).resolve().parent.parent
+BOOKS_DIR = BASE_DIR / 'data' / 'books'
+VECTORS_DIR = BASE_DIR / 'data' / 'index' / 'vectors'   # <book_id>.npy per book, plus idf.npy
+
+# Every reader page is one passage, stored as a DIM-dimensional float32
+# vector: its TF-IDF weights, feature-hashed into DIM signed buckets and
+# L2-normalized, so a dot product is the cosine similarity.
+# 256 floats are 1 KB per page, ~150 MB for a thousand average books;
+# a larger DIM means fewer words sharing a bucket, at the cost of memory.
+DIM = 256
+# Document frequencies are counted in this many hash buckets, which is
+# enough that distinct words almost never share an IDF
+IDF_BUCKETS = 1 << 20
+# Words on more than ~40% of all pages ("the", "said", ...) are left out:
+# they carry no meaning but would crowd the few buckets a passage has
+MIN_IDF = 1.9
+TOP_K = 5
+# The vectors only shortlist this many passages; they are ranked by how much
+# of the query's IDF weight appears among their actual words, because words
+# sharing a bucket make unrelated passages look similar
+CANDIDATES = 50
+SNIPPET_CHARS = 300
+
+# --- EMBEDDING ---
+@lru_cache(maxsize=1 << 18)
+def _hashes(token: str):
+    h = zlib.crc32(token.encode('utf-8'))
+    # (DIM bucket, its sign, IDF bucket) from different bits of one hash
+    return h % DIM, 1.0 if h & 0x80000000 else -1.0, (h >> 8) % IDF_BUCKETS
+
+def _weigh_unseen(idf: np.ndarray) -> np.ndarray:
+    # Words no page had at the last full build are the rarest of all
+    return np.where(idf > 0, idf, idf.max()).astype(np.float32)
+
+def load_idf() -> Optional[np.ndarray]:
+    try:
+        return _weigh_unseen(np.load(VECTORS_DIR / 'idf.npy'))
+    except (OSError, ValueError, EOFError):
+        return None
+
+def embed(text: str, idf: Optional[np.ndarray]) -> np.ndarray:
+    """The normalized vector of a passage or a query. Without IDF every word weighs the same."""
+    counts = Counter(tokenize(text))
+    vector = np.zeros(DIM, dtype=np.float32)
+    if not counts: return vector
+    buckets, weights = [], []
+    for token, count in counts.items():
+        bucket, sign, idf_bucket = _hashes(token)
+        weight = idf[idf_bucket] if idf is not None else 1.0
+        if weight < MIN_IDF and idf is not None: continue
+        buckets.append(bucket)
+        weights.append(sign * (1.0 + math.log(count)) * weight)
+    vector += np.bincount(buckets, weights=weights, minlength=DIM).astype(np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+# --- BUILDING ---
+def _pages(book_id: str) -> List[str]:
+    manifest = artifacts.ensure(book_id)
+    if manifest is None: return []
+    with open(BOOKS_DIR / str(book_id) / artifacts.CLEAN_NAME, 'rb') as f:
+        data = f.read()
+    offsets = manifest['pages'] + [len(data)]
+    return [data[start:end].decode('utf-8', 'replace') for start, end in zip(offsets, offsets[1:])]
+
+def shard_path(book_id: str) -> Path:
+    return VECTORS_DIR / f'{book_id}.npy'
+
+def _save(target: Path, array: np.ndarray):
+    VECTORS_DIR.mkdir(parents=True, exist_ok=True)
+    temp = target.with_name(f'.{target.name}.tmp')
+    with open(temp, 'wb') as f:
+        np.save(f, array)
+    os.replace(temp, target)
+
+def build_book(book_id: str, idf: Optional[np.ndarray] = None) -> str:
+    """
+    (Re)build one book's passage vectors if its text changed since.
+    Uses the IDF of the last full build; words it has not seen weigh the most.
+    """
+    book_id = str(book_id)
+    manifest = artifacts.ensure(book_id)
+    if manifest is None:
+        shard_path(book_id).unlink(missing_ok=True)
+        return 'no text'
+    pages_file = BOOKS_DIR / book_id / artifacts.PAGES_NAME
+    try:
+        if shard_path(book_id).stat().st_mtime_ns >= pages_file.stat().st_mtime_ns \
+                and np.load(shard_path(book_id), mmap_mode='r').shape[1:] == (DIM,):
+            return 'up to date'
+    except (OSError, ValueError, EOFError):
+        pass
+    if idf is None: idf = load_idf()
+    pages = _pages(book_id)
+    matrix = np.stack([embed(page, idf) for page in pages]) if pages else np.zeros((0, DIM), np.float32)
+    _save(shard_path(book_id), matrix)
+    return f'{len(pages)} passages'
+
+def build_all() -> int:
+    """Count document frequencies over every page of every book, then rebuild all vectors with them."""
+    book_ids = [p.name for p in BOOKS_DIR.iterdir() if p.is_dir() and not p.name.startswith('.')]
+    df = np.zeros(IDF_BUCKETS, dtype=np.int32)
+    passages = 0
+    for book_id in book_ids:
+        for page in _pages(book_id):
+            df[list({_hashes(t)[2] for t in tokenize(page)})] += 1
+            passages += 1
+    # Buckets no page has are stored as 0 and weighed by _weigh_unseen() when loaded
+    idf = np.where(df > 0, np.log((passages + 1) / (df + 1)) + 1, 0).astype(np.float32)
+    _save(VECTORS_DIR / 'idf.npy', idf)
+    idf = _weigh_unseen(idf)
+    for book_id in book_ids:
+        shard_path(book_id).unlink(missing_ok=True)
+        build_book(book_id, idf)
+    return len(book_ids)
+
+# --- THE INDEX ---
+class VectorIndex:
+    """
+    Every book's passage vectors as one float32 matrix per book, so a query
+    is a matrix-vector product per book plus a partial sort of the scores,
+    followed by a rerank of the CANDIDATES best passages by the query words
+    they contain.
+
+    On the first search after the shard folder changed (one stat() tells),
+    only the shards whose mtime moved are loaded again.
+    """
+
+    def __init__(self, vectors_dir: Path):
+        self.vectors_dir = vectors_dir
+        self._lock = threading.Lock()
+        self._version = None
+        self._shards: Dict[str, Tuple[int, np.ndarray]] = {}  # book_id -> (mtime_ns, its passage vectors)
+        self._books: List[str] = []
+        self._offsets = np.zeros(1, dtype=np.int64)           # the rows of _books[i] start at _offsets[i]
+        self._idf_mtime = None
+        self._idf: Optional[np.ndarray] = None
+
+    def _refresh(self):
+        try:
+            version = self.vectors_dir.stat().st_mtime_ns
+        except OSError:
+            version = None
+        if version == self._version: return
+
+        # Shards are replaced by a rename, so an unchanged mtime means unchanged contents
+        mtimes = {}
+        if version is not None:
+            with os.scandir(self.vectors_dir) as entries:
+                for entry in entries:
+                    if not entry.name.endswith('.npy'): continue
+                    try:
+                        mtimes[entry.name[:-len('.npy')]] = entry.stat().st_mtime_ns
+                    except OSError:
+                        pass
+        idf_mtime = mtimes.pop('idf', None)
+        if idf_mtime != self._idf_mtime:
+            self._idf, self._idf_mtime = load_idf(), idf_mtime
+
+        shards = {}
+        for book_id in sorted(mtimes):
+            cached = self._shards.get(book_id)
+            if cached is not None and cached[0] == mtimes[book_id]:
+                shards[book_id] = cached
+                continue
+            try:
+                shard = np.load(self.vectors_dir / f'{book_id}.npy')
+            except (OSError, ValueError, EOFError):
+                continue
+            if shard.ndim != 2 or shard.shape[1] != DIM: continue   # built with another DIM
+            shards[book_id] = (mtimes[book_id], shard.astype(np.float32, copy=False))
+        self._shards = shards
+        self._books = list(shards)
+        self._offsets = np.cumsum([0] + [len(matrix) for _, matrix in shards.values()])
+        self._version = version
+
+    def _page_text(self, book_id: str, page: int, table: Dict) -> str:
+        """A reader page's text, without the words cut in half at its edges."""
+        pages = table['pages']
+        start = pages[page]
+        end = pages[page + 1] if page + 1 < len(pages) else None
+        # Pages are cut every CHUNK_SIZE characters, so read a character more
+        # on each side (up to 4 bytes in UTF-8) to see whether a word goes on
+        head = min(start, 4)
+        with open(BOOKS_DIR / book_id / artifacts.CLEAN_NAME, 'rb') as f:
+            f.seek(start - head)
+            data = f.read() if end is None else f.read(end - start + head + 4)
+        body_end = len(data) if end is None else head + end - start
+        before = data[:head].decode('utf-8', 'ignore')[-1:]
+        after = data[body_end:].decode('utf-8', 'ignore')[:1]
+        text = display_text(data[head:body_end].decode('utf-8', 'surrogateescape'))
+        if re.match(r'\w', before): text = re.sub(r'^\w+', '', text)
+        if re.match(r'\w', after):
+            cut = len(text)
+            while cut and re.match(r'\w', text[cut - 1]): cut -= 1
+            text = text[:cut]
+        return re.sub(r'^[\W_]+(?=\w|["“‘\'(])', '', text.strip())
+
+    def _snippet(self, text: str, words: set) -> str:
+        # The sentence that shares the most words with the query
+        sentences = re.split(r'(?<=[.!?])\s+', text)
+        best = max(sentences, key=lambda s: len(words & set(tokenize(s))), default='')
+        best = ' '.join(best.split())
+        if len(best) > SNIPPET_CHARS: best = best[:SNIPPET_CHARS].rsplit(' ', 1)[0] + '...'
+        return best
+
+    def search(self, query: str, limit: int = TOP_K) -> List[Dict]:
+        """
+        The passages most relevant to `query`, best first, as dicts with
+        'book_id', 'page' (zero-based), 'score' (the cosine similarity),
+        'overlap' (the share of the query's weight found in the passage)
+        and 'snippet'. Passages without any of the query's words are left out.
+        """
+        with self._lock:
+            self._refresh()
+            matrices = [matrix for _, matrix in self._shards.values()]
+            books, offsets, idf = self._books, self._offsets, self._idf
+        vector = embed(query, idf)
+        if not offsets[-1] or not vector.any(): return []
+
+        scores = np.concatenate([matrix @ vector for matrix in matrices])
+        shortlist = min(max(limit, CANDIDATES), len(scores))
+        top = np.argpartition(-scores, shortlist - 1)[:shortlist]
+        top = top[np.argsort(-scores[top])]
+
+        # The words that made it into the query vector, with their weights
+        words = set(tokenize(query))
+        weights = {w: float(idf[_hashes(w)[2]]) if idf is not None else 1.0 for w in words}
+        weights = {w: weight for w, weight in weights.items() if idf is None or weight >= MIN_IDF}
+        if not weights: return []
+        total = sum(weights.values())
+        # Finds just the query's words in a passage, faster than tokenizing all of it
+        word_re = re.compile(r'\b(?:%s)\b' % '|'.join(map(re.escape, sorted(weights, key=len, reverse=True))),
+                             re.IGNORECASE)
+
+        ranked, tables = [], {}
+        for row in top:
+            if scores[row] <= 0: break
+            book = int(np.searchsorted(offsets, row, side='right')) - 1
+            book_id, page = books[book], int(row - offsets[book])
+            if book_id not in tables: tables[book_id] = artifacts.read_manifest(book_id)
+            table = tables[book_id]
+            if not table or page >= len(table['pages']): continue
+            text = self._page_text(book_id, page, table)
+            found = weights.keys() & {w.lower() for w in word_re.findall(text)}
+            if not found: continue
+            ranked.append((sum(weights[w] for w in found) / total, float(scores[row]), book_id, page, text))
+        ranked.sort(key=lambda r: r[:2], reverse=True)
+
+        return [{'book_id': book_id, 'page': page, 'score': score, 'overlap': overlap,
+                 'snippet': self._snippet(text, words)}
+                for overlap, score, book_id, page, text in ranked[:limit]]
+
+
+vector_index = VectorIndex(VECTORS_DIR)
+
+# --- BUILD STEP ---
+# python -m services.vectors                  recount IDF and rebuild every book's vectors
+# python -m services.vectors 84 1342          (re)build just these books with the current IDF
+# python -m services.vectors --search "..."   try a query
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if args[:1] == ['--search']:
+        started = time.perf_counter()
+        results = vector_index.search(' '.join(args[1:]))
+        print(f'{(time.perf_counter() - started) * 1000:.1f} ms')
+        for result in results:
+            print(f"{result['book_id']} page {result['page'] + 1} ({result['overlap']:.2f}, {result['score']:.3f}): "
+                  f"{result['snippet']}")
+    elif args:
+        for book_id in args:
+            print(book_id, build_book(book_id))
+    else:
+        print(f'{build_all()} books embedded')
@@ -1,4 +1,5 @@
-from nicegui import ui, app
+from nicegui import ui
+from services import static
 from pages import home, about, books, chatbot, study_planner, login, upload, profile, bookmark
 import pages.book.book_details 
 from pathlib import Path
@@ -10,7 +11,7 @@ import pages.reader.reader
 BASE_DIR = Path(__file__).parent
 ASSETS_DIR = BASE_DIR / 'data' / 'assets'
 
-app.add_static_files('/assets', ASSETS_DIR)
+static.add_static_files('/assets', ASSETS_DIR)
 
 
 
@@ -0,0 +1,102 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from nicegui import core
+
+from services import covers, thumbnails
+from services.covers import CoverMirror
+
+JPEG = b'\xff\xd8\xff\xe0' + b'\x00' * 64
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """/cover.jpg is an image, anything else an HTML error page."""
+
+    def do_GET(self):
+        if self.path == '/cover.jpg':
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/jpeg')
+            body = JPEG
+        else:
+            self.send_response(404)
+            self.send_header('Content-Type', 'text/html')
+            body = b'<h1>Not Found</h1>'
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{httpd.server_port}'
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def books_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(covers, 'BOOKS_DIR', tmp_path)
+    monkeypatch.setattr(thumbnails, 'BOOKS_DIR', tmp_path)
+    return tmp_path
+
+
+def book(url):
+    return {'title': 'Moby Dick', 'formats': {'image/jpeg': url}}
+
+
+async def run_mirror(monkeypatch, test):
+    monkeypatch.setattr(core, 'loop', asyncio.get_running_loop())
+    mirror = CoverMirror()
+    mirror.start()
+    try:
+        await test(mirror)
+    finally:
+        for task in asyncio.all_tasks() - {asyncio.current_task()}:
+            task.cancel()
+        await mirror.stop()
+
+
+def test_queue_mirrors_covers(server, books_dir, monkeypatch):
+    (books_dir / '2701').mkdir()
+    (books_dir / '84').mkdir()
+
+    async def test(mirror):
+        mirror.request('2701', book(f'{server}/cover.jpg'))
+        mirror.request('2701', book(f'{server}/cover.jpg'))   # already queued
+        mirror.request('84', book(f'{server}/missing.jpg'))
+        assert mirror._queue.qsize() == 2
+        await mirror._queue.join()
+
+        assert (books_dir / '2701' / 'cover.jpg').read_bytes() == JPEG
+        assert '2701' not in mirror._failed
+        assert '84' in mirror._failed
+        assert not mirror._pending
+        assert not any((books_dir / '84').iterdir())   # no half-written download left behind
+
+        # A failed cover isn't retried before RETRY_AFTER
+        mirror.request('84', book(f'{server}/missing.jpg'))
+        assert mirror._queue.empty()
+
+    asyncio.run(run_mirror(monkeypatch, test))
+
+
+def test_placeholder_until_mirrored(server, books_dir, monkeypatch):
+    (books_dir / '2701').mkdir()
+    monkeypatch.setattr(thumbnails, 'catalog', {'2701': book(f'{server}/cover.jpg')})
+
+    async def test(mirror):
+        monkeypatch.setattr(thumbnails, 'cover_mirror', mirror)
+        response = await thumbnails.serve_thumb(None, '2701', 'md')
+        assert response.media_type == 'image/svg+xml'
+        assert b'>MD</text>' in response.body
+        await mirror._queue.join()
+        assert thumbnails.cover_path('2701') == books_dir / '2701' / 'cover.jpg'
+
+    asyncio.run(run_mirror(monkeypatch, test))
@@ -0,0 +1,19 @@
+from services.facets import FacetIndex, book_facets
+
+
+def test_null_author_name():
+    assert book_facets({'authors': [{'name': None}, {}]})['author'] == ['Unknown', 'Unknown']
+
+
+def test_counts_follow_changes():
+    index = FacetIndex()
+    index.add('1', {'languages': ['en']})
+    index.add('2', {'languages': ['fr']})
+    index.add('3', {'languages': ['fr']})
+    assert index.counts('language') == [('fr', 2), ('en', 1)]
+    assert index.counts('language', 1) == [('fr', 2)]
+
+    index.remove('2')
+    index.remove('3')
+    assert index.counts('language') == [('en', 1)]
+    assert index.counts('language', 1) == [('en', 1)]
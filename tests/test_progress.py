@@ -0,0 +1,24 @@
+import asyncio
+
+import pytest
+
+from services.progress import ProgressStore
+
+
+def test_failed_flush_keeps_the_batch(tmp_path, monkeypatch):
+    store = ProgressStore(tmp_path)
+    store.record('alice', '1342', 3)
+    store.record('bob', '2701', 7)
+
+    def failing_append(user, records):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(store, '_append', failing_append)
+    with pytest.raises(OSError):
+        asyncio.run(store.flush())
+    store.record('alice', '1342', 4)
+
+    monkeypatch.undo()
+    store.flush_now()
+    assert ProgressStore(tmp_path).get_page('alice', '1342') == 4
+    assert ProgressStore(tmp_path).get_page('bob', '2701') == 7
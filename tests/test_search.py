@@ -0,0 +1,29 @@
+from services.search import SearchIndex, book_fields
+
+
+def make_index(books):
+    index = SearchIndex()
+    for book_id, book in books.items():
+        index.add(book_id, book)
+    return index
+
+
+def test_null_author_name():
+    book = {'title': 'Beowulf', 'authors': [{'name': None}, {'name': 'Heaney, Seamus'}]}
+    assert book_fields(book)['author'] == ' Heaney, Seamus'
+    assert make_index({'981': book}).search('heaney') == ['981']
+
+
+def test_one_letter_query():
+    index = make_index({
+        '1342': {'title': 'Pride and Prejudice', 'authors': [{'name': 'Austen, Jane'}]},
+        '2701': {'title': 'Moby Dick', 'authors': [{'name': 'Melville, Herman'}]},
+    })
+    assert index.search('p') == ['1342']
+    assert index.search('P pre') == ['1342']
+
+
+def test_short_prefix_reaches_common_words():
+    books = {str(i): {'title': f'tha{i:03d}'} for i in range(300)}
+    books['the'] = {'title': 'The Odyssey'}
+    assert 'the' in make_index(books).search('th')
@@ -0,0 +1,31 @@
+import os
+
+import numpy as np
+
+from services.vectors import DIM, VectorIndex
+
+
+def save_shard(vectors_dir, name, rows):
+    temp = vectors_dir / f'.{name}.npy.tmp'
+    with open(temp, 'wb') as f:
+        np.save(f, np.ones((rows, DIM), np.float32))
+    os.replace(temp, vectors_dir / f'{name}.npy')
+
+
+def test_refresh_reloads_only_changed_shards(tmp_path):
+    save_shard(tmp_path, '84', 3)
+    save_shard(tmp_path, '1342', 2)
+    np.save(tmp_path / 'odd.npy', np.ones((2, DIM + 1), np.float32))
+    index = VectorIndex(tmp_path)
+    index._refresh()
+    assert index._books == ['1342', '84']
+    assert list(index._offsets) == [0, 2, 5]
+    kept = index._shards['84'][1]
+
+    save_shard(tmp_path, '1342', 4)
+    (tmp_path / '46.npy').touch()   # unreadable, skipped
+    os.utime(tmp_path, ns=(0, 0))   # make sure the folder's mtime moves even on coarse filesystems
+    index._refresh()
+    assert index._books == ['1342', '84']
+    assert list(index._offsets) == [0, 4, 7]
+    assert index._shards['84'][1] is kept